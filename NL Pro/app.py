@@ -6,19 +6,28 @@ load_dotenv()
 
 import io
 import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from datetime import datetime
 from pandas.api.types import is_numeric_dtype, is_datetime64_any_dtype
 import pandas as pd
-from flask import Flask, jsonify, render_template, request, send_file
+from flask import Flask, Response, g, jsonify, render_template, request, send_file
 from flask_cors import CORS
 
-from services import db, gemini  # our helpers
+from services import (  # our helpers
+    cache, compress, db, export, gemini, incremental, limits, metrics, params, profiling, refine, saved,
+    singleflight, validate,
+)
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
 CORS(app)
 
 app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "dev-secret")
-app.config["ASSET_VERSION"] = os.getenv("ASSET_VERSION", "6")  # bump to bust JS/CSS cache
+app.config["ASSET_VERSION"] = os.getenv("ASSET_VERSION", "9")  # bump to bust JS/CSS cache
 
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "")
 if ALLOWED_ORIGINS:
@@ -28,9 +37,178 @@ if ALLOWED_ORIGINS:
 HISTORY_PATH = os.path.join("storage", "query_history.json")
 os.makedirs("storage", exist_ok=True)
 
-# Load schema (and dialect) at startup
-FULL_SCHEMA = db.get_schema()                 # {table: [ {name,type,pk,fk}, ... ], ...}
+# Recent result frames kept server-side so follow-ups can be refined in-process
+# (local LRU in front of the shared cache, so any worker can answer a follow-up),
+# bounded by entry count and by the frames' total in-memory footprint
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "32"))
+RESULT_CACHE_BYTES = int(os.getenv("RESULT_CACHE_BYTES", str(256 * 2**20)))
+_RESULTS: "OrderedDict[str, tuple[pd.DataFrame, str, int]]" = OrderedDict()  # id -> (df, sql, bytes)
+_results_bytes = 0
+_RESULTS_LOCK = threading.Lock()
+
+# Shared (cross-worker) cache lifetimes, in seconds; 0 disables
+SCHEMA_TTL = float(os.getenv("SCHEMA_TTL", "3600"))
+SQL_CACHE_TTL = float(os.getenv("SQL_CACHE_TTL", "86400"))
+RESULT_TTL = float(os.getenv("RESULT_TTL", "300"))
+RESULT_ID_TTL = float(os.getenv("RESULT_ID_TTL", "1800"))
+
+# Streamed exports read the cursor in batches of this many rows
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "10000"))
+EXCEL_MAX_ROWS = 1048575  # one worksheet, header row excluded
+
+# /query/batch: generation and execution run on separate bounded pools
+# (threads start lazily, so creating the pools before fork is safe)
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+_LLM_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("BATCH_LLM_WORKERS", "8")),
+                               thread_name_prefix="batch-llm")
+_DB_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("BATCH_DB_WORKERS", "5")),
+                              thread_name_prefix="batch-db")
+
+# Identical concurrent questions / SQL share one in-flight LLM call / query
+_SQL_FLIGHT = singleflight.Group("sql")
+_RESULT_FLIGHT = singleflight.Group("result")
+_SAVED_FLIGHT = singleflight.Group("saved_result")
+
+# Load schema (and dialect) at startup; workers share one introspection
 DIALECT = db.get_dialect()                    # e.g. 'postgresql'
+_SCHEMA_KEY = cache.key("schema", db.DATABASE_URL)
+FULL_SCHEMA = cache.get("schema", _SCHEMA_KEY)  # {table: [ {name,type,pk,fk}, ... ], ...}
+if FULL_SCHEMA is None:
+    FULL_SCHEMA = db.get_schema()
+    cache.set("schema", _SCHEMA_KEY, FULL_SCHEMA, SCHEMA_TTL)
+SCHEMA_INDEX = validate.SchemaIndex(FULL_SCHEMA, DIALECT)  # local check of generated SQL
+# hot-table copy, replica checks and the saved-query scheduler start per
+# worker process, not here: see start_background()
+
+
+# ------------------------------ timing ------------------------------
+
+@contextmanager
+def _stage(name: str, timings: dict | None = None, endpoint: str | None = None):
+    """
+    Time one stage of the current request (Server-Timing + /metrics).
+    Worker threads have no request context, so they pass `timings`/`endpoint`.
+    """
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        if timings is None:
+            timings = g.setdefault("timings", {})
+        timings[name] = timings.get(name, 0.0) + dt
+        metrics.STAGE_SECONDS.observe(dt, endpoint=endpoint or request.endpoint or "unknown", stage=name)
+
+def _admin_token() -> str:
+    # header only: a query-string token would end up in access logs
+    return request.headers.get("X-Admin-Token", "")
+
+@app.before_request
+def _start_request_timer():
+    g.t0 = time.perf_counter()
+    # opt-in sampling profile: "X-Profile: 1" plus a valid admin token
+    if request.headers.get("X-Profile") and profiling.authorized(_admin_token()):
+        g.profiler = profiling.SamplingProfiler(threading.get_ident()).start()
+
+def _server_timing(timings: dict, total: float) -> str:
+    parts = [f"{k};dur={v * 1000:.1f}" for k, v in timings.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+def _log_if_slow(endpoint: str, status: int, total: float, timings: dict, info: dict | None):
+    if not info or total * 1000 < profiling.SLOW_QUERY_MS:
+        return
+    entry = {
+        "ts": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "endpoint": endpoint,
+        "status": status,
+        "total_ms": round(total * 1000, 1),
+        "stages_ms": {k: round(v * 1000, 1) for k, v in timings.items()},
+        **info,
+    }
+    # EXPLAIN costs a round trip: one writer thread per process, bounded queue
+    profiling.submit_slow(entry, _explain)
+
+def _explain(sql: str):
+    # only with a free DB slot: a struggling database gets no extra queries
+    if not limits.DB.acquire(blocking=False):
+        raise RuntimeError("database busy; plan skipped")
+    try:
+        return db.explain(sql)
+    finally:
+        limits.DB.release()
+
+@app.after_request
+def _emit_timings(resp):
+    t0 = g.get("t0", time.perf_counter())
+    endpoint, status = request.endpoint or "unknown", resp.status_code
+    timings, info = g.get("timings", {}), g.get("query_info")
+    # streamed bodies (exports) are produced after this hook: the header can only
+    # carry the stages up to the first byte, the rest is accounted for on close
+    resp.headers["Server-Timing"] = _server_timing(timings, time.perf_counter() - t0)
+
+    profiler = g.pop("profiler", None)
+    profile_id = profiling.new_profile_id() if profiler is not None else None
+    if profile_id:
+        resp.headers["X-Profile-Id"] = profile_id
+
+    def finish():
+        # no request context here when called on close: everything is captured above
+        total = time.perf_counter() - t0
+        metrics.REQUEST_SECONDS.observe(total, endpoint=endpoint, status=status)
+        if profiler is not None:
+            profiling.save_profile(profiler.stop(), {"endpoint": endpoint, "total_ms": round(total * 1000, 1)},
+                                   profile_id)
+        _log_if_slow(endpoint, status, total, timings, info)
+
+    if resp.is_streamed:
+        resp.call_on_close(finish)
+    else:
+        finish()
+    return resp
+
+def _counted(chunks, on_chunk):
+    try:
+        for chunk in chunks:
+            on_chunk(len(chunk), len(chunk))
+            yield chunk
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+# registered after _emit_timings, so it runs first (Flask runs these in reverse)
+@app.after_request
+def _compress_response(resp):
+    """gzip/zstd per Accept-Encoding; streamed bodies are compressed as they go."""
+    endpoint = request.endpoint or "unknown"
+    encoding = None
+    if resp.status_code == 200 and "Content-Encoding" not in resp.headers and compress.compressible(resp.mimetype):
+        resp.vary.add("Accept-Encoding")
+        encoding = compress.negotiate(request.headers.get("Accept-Encoding"))
+
+    def count(raw: int, sent: int, enc: str = encoding or "identity"):
+        metrics.RAW_BYTES.inc(raw, endpoint=endpoint, encoding=enc)
+        metrics.BYTES_SENT.inc(sent, endpoint=endpoint, encoding=enc)
+
+    if resp.is_streamed:
+        if encoding:
+            resp.response = compress.compress_stream(resp.response, encoding, count)
+        else:
+            resp.response = _counted(resp.response, count)
+    else:
+        raw = resp.get_data()
+        if encoding and len(raw) >= compress.COMPRESS_MIN_BYTES:
+            resp.set_data(compress.compress_bytes(raw, encoding))
+        else:
+            encoding = None
+        count(len(raw), resp.content_length or 0, encoding or "identity")
+    if encoding:
+        resp.headers["Content-Encoding"] = encoding
+        resp.headers.pop("Content-Length", None)
+        if resp.is_streamed:
+            resp.direct_passthrough = False
+    return resp
 
 
 # ------------------------------ helpers ------------------------------
@@ -41,6 +219,25 @@ def _subset_schema(full_schema: dict, tables: list[str] | None) -> dict:
     wanted = set(tables)
     return {t: cols for t, cols in full_schema.items() if t in wanted}
 
+def _coerce_numeric(df: pd.DataFrame) -> pd.DataFrame:
+    # object columns that are fully numeric (e.g. Decimal) become real numbers;
+    # so do categoricals (services/frames.py) of numeric strings
+    for c in df.columns:
+        if isinstance(df[c].dtype, pd.CategoricalDtype):
+            try:
+                if df[c].cat.categories.empty:
+                    continue
+                pd.to_numeric(df[c].cat.categories)
+            except (ValueError, TypeError):
+                continue
+            df[c] = pd.to_numeric(df[c].astype(object))
+        elif df[c].dtype == "object":
+            try:
+                df[c] = pd.to_numeric(df[c])
+            except (ValueError, TypeError):
+                pass
+    return df
+
 def _dtype_label(series: pd.Series) -> str:
     # 1) native datetime
     if is_datetime64_any_dtype(series):
@@ -79,16 +276,230 @@ def _rows_for_json(df: pd.DataFrame):
         out.append([conv(v) for v in row])
     return out
 
+def _frame_bytes(df: pd.DataFrame, deep: bool = False) -> int:
+    # db frames carry their deep footprint; otherwise an estimate (shallow unless asked)
+    size = df.attrs.get("memory_bytes")
+    if size is None:
+        size = int(df.memory_usage(index=deep, deep=deep).sum())
+    return size
+
+def _remember_result(result_id: str, df: pd.DataFrame, sql: str):
+    global _results_bytes
+    size = _frame_bytes(df, deep=True)  # /refine frames have no recorded footprint
+    if size > RESULT_CACHE_BYTES:
+        return  # would evict everything else; the shared cache (if it fits there) still has it
+    with _RESULTS_LOCK:
+        old = _RESULTS.pop(result_id, None)
+        if old is not None:
+            _results_bytes -= old[2]
+        _RESULTS[result_id] = (df, sql, size)
+        _results_bytes += size
+        while len(_RESULTS) > RESULT_CACHE_SIZE or _results_bytes > RESULT_CACHE_BYTES:
+            _, (_, _, evicted) = _RESULTS.popitem(last=False)
+            _results_bytes -= evicted
+
+def _shareable(df: pd.DataFrame) -> bool:
+    # size check so huge frames are never pickled at all
+    return _frame_bytes(df) <= cache.CACHE_MAX_BYTES
+
+def _cache_result(df: pd.DataFrame, sql: str, result_id: str | None = None) -> str:
+    # result_id: the frame is already in the shared cache under that id (_share_result)
+    if result_id:
+        _remember_result(result_id, df, sql)
+        return result_id
+    result_id = uuid.uuid4().hex
+    _remember_result(result_id, df, sql)
+    if _shareable(df):
+        cache.set("result_id", result_id, (df, sql), RESULT_ID_TTL)
+    return result_id
+
+def _share_result(k: str, df: pd.DataFrame, sql: str, ttl: float, ns: str = "result") -> None:
+    """
+    Store a fetched frame once, under a fresh result_id; the SQL key (in `ns`)
+    only points at it, so follow-ups on the same result reuse the same entry.
+    """
+    result_id = uuid.uuid4().hex
+    if cache.set("result_id", result_id, (df, sql), max(ttl, RESULT_ID_TTL)):
+        cache.set(ns, k, result_id, ttl)
+        df.attrs["result_id"] = result_id
+
+def _shared_result(k: str, ns: str = "result") -> pd.DataFrame | None:
+    result_id = cache.get(ns, k)
+    hit = cache.get("result_id", result_id) if result_id else None
+    if hit is None:
+        return None
+    df = hit[0]
+    df.attrs["result_id"] = result_id
+    return df
+
+def _cached_result(result_id: str):
+    with _RESULTS_LOCK:
+        hit = _RESULTS.get(result_id or "")
+        if hit is not None:
+            _RESULTS.move_to_end(result_id)
+            return hit[:2]
+    hit = cache.get("result_id", result_id) if result_id else None
+    if hit is not None:
+        # frames shared by _fetch are stored as fetched; coerce like _finish did
+        hit = (_coerce_numeric(hit[0]), hit[1])
+        _remember_result(result_id, *hit)
+    return hit
+
+def _normalize_sql(sql: str) -> str:
+    return " ".join((sql or "").split())
+
+def _result_cache_key(sql: str) -> str:
+    return cache.key(_normalize_sql(sql))
+
+def _sql_cache_key(question: str, schema_subset: dict) -> str:
+    return cache.key(" ".join(question.lower().split()), schema_subset, DIALECT)
+
+def _shape_cache_key(shape: str, schema_subset: dict) -> str:
+    return cache.key("shape", shape, schema_subset, DIALECT)
+
+def _from_shape(question: str, schema_subset: dict) -> str | None:
+    """SQL for a question that only differs in literal values from one already answered."""
+    shape, literals = params.question_shape(question)
+    if not literals:
+        return None  # nothing to vary: the exact-question cache covers it
+    entry = cache.get("shape", _shape_cache_key(shape, schema_subset))
+    metrics.CACHE_LOOKUPS.inc(cache="shape", outcome="miss" if entry is None else "hit")
+    if entry is None:
+        return None
+    template, binds, slots = entry
+    binds = params.bind_shape(binds, slots, literals)
+    return params.render(template, binds) if binds is not None else None
+
+def _remember_shape(question: str, schema_subset: dict, sql: str):
+    shape, literals = params.question_shape(question)
+    if not literals:
+        return
+    template, binds = params.parameterize(sql)
+    slots = params.slots(binds, literals)
+    if slots is not None:
+        cache.set("shape", _shape_cache_key(shape, schema_subset), (template, binds, slots), SQL_CACHE_TTL)
+
+def _generate_cached(question: str, schema_subset: dict) -> str:
+    """
+    gemini.generate_sql behind the shared cache (same question+schema -> same
+    SQL; same question shape -> same template with the new values bound).
+    """
+    k = _sql_cache_key(question, schema_subset)
+    sql = cache.get("sql", k)
+    metrics.CACHE_LOOKUPS.inc(cache="sql", outcome="miss" if sql is None else "hit")
+    if sql is None:
+        sql = _from_shape(question, schema_subset)
+    if sql is None:
+        sql = _SQL_FLIGHT.do(k, lambda: _generate(question, schema_subset, k))
+    return sql
+
+def _llm(question: str, schema_subset: dict, feedback: str | None = None) -> str:
+    # every model request (hedge and retries too) takes its own LLM slot
+    try:
+        sql = gemini.generate_sql(question, schema_subset, dialect=DIALECT, feedback=feedback, gate=limits.LLM)
+    except Exception:
+        metrics.LLM_CALLS.inc(outcome="error")
+        raise
+    metrics.LLM_CALLS.inc(outcome="ok")
+    return sql
+
+def _checked(sql: str, repaired: bool) -> str | None:
+    """Validate against FULL_SCHEMA; returns the problem (None if fine) and counts the outcome."""
+    problem = SCHEMA_INDEX.check(sql)
+    if problem is None:
+        metrics.SQL_VALIDATION.inc(outcome="repaired" if repaired else "ok")
+    else:
+        metrics.SQL_VALIDATION.inc(outcome="failed" if repaired else "invalid")
+    return problem
+
+def _generate(question: str, schema_subset: dict, k: str) -> str:
+    sql = _llm(question, schema_subset)
+    problem = _checked(sql, repaired=False)
+    if problem:
+        # one bounded repair round instead of a database error
+        sql = _llm(question, schema_subset, feedback=validate.feedback(sql, problem))
+        problem = _checked(sql, repaired=True)
+        if problem:
+            raise validate.InvalidSQL(problem, sql)
+    cache.set("sql", k, sql, SQL_CACHE_TTL)
+    _remember_shape(question, schema_subset, sql)
+    return sql
+
+def _run_cached(sql: str) -> pd.DataFrame:
+    """db.run_sql behind the shared result cache (keyed on normalized SQL)."""
+    k = _result_cache_key(sql)
+    df = _shared_result(k)
+    metrics.CACHE_LOOKUPS.inc(cache="result", outcome="miss" if df is None else "hit")
+    if df is None:
+        # coalesced callers get the same frame; shallow copies keep the
+        # in-place coercion in _finish from touching another request's frame
+        df = _RESULT_FLIGHT.do(k, lambda: _fetch(sql, k)).copy(deep=False)
+    return df
+
+def _run(sql: str) -> pd.DataFrame:
+    # literals become binds: one statement text per query shape for the planner
+    template, binds = params.parameterize(sql)
+    with limits.DB.slot():
+        return db.run_sql(template, binds)
+
+def _fetch(sql: str, k: str) -> pd.DataFrame:
+    df = _run(sql)
+    if _shareable(df):
+        _share_result(k, df, sql, RESULT_TTL)
+    return df
+
+def _fetch_saved(item: dict) -> pd.DataFrame:
+    """Run a saved query's pinned SQL into the saved-result cache, kept until its next refresh."""
+    sql = item["sql"]
+    k = _result_cache_key(sql)
+    # saved results (possibly incremental, INCREMENTAL_FULL_SECONDS) live in their own
+    # namespace: /query and the exports never read them, and /saved/<id>/run reports their age
+    df = incremental.fetch(sql, k, _run, _shareable)
+    if _shareable(df):
+        _share_result(k, df, sql, saved.result_ttl(item), ns="saved_result")
+    return df
+
+def _refresh_saved(item: dict) -> int:
+    return len(_fetch_saved(item))
+
+# ------------------------------ background work ------------------------------
+
+# Under gunicorn preload_app this module is imported in the master, which
+# must not run any of this: workers call start_background() from post_fork,
+# the dev server on its first request, asgi.py from its lifespan startup.
+_background_pid: int | None = None
+_background_lock = threading.Lock()
+
+def start_background() -> bool:
+    """Start this process's background threads (once per process); True if started now."""
+    global _background_pid
+    with _background_lock:
+        if _background_pid == os.getpid():
+            return False
+        _background_pid = os.getpid()
+    db.start_hot_replica()                    # local copy of HOT_TABLES (if any)
+    db.start_replica_checks()                 # health/lag of REPLICA_URLS (if any)
+    saved.start_scheduler(_refresh_saved)     # re-runs due saved queries (SAVED_TICK_SECONDS)
+    return True
+
+@app.before_request
+def _ensure_background():
+    if _background_pid != os.getpid():
+        start_background()
+
+_HISTORY_LOCK = threading.Lock()  # batch items finish on several threads at once
+
 def _append_history(entry: dict):
     try:
-        items = []
-        if os.path.exists(HISTORY_PATH):
-            with open(HISTORY_PATH, "r", encoding="utf-8") as f:
-                items = json.load(f)
-        items.insert(0, entry)
-        items = items[:200]
-        with open(HISTORY_PATH, "w", encoding="utf-8") as f:
-            json.dump(items, f, indent=2)
+        with _HISTORY_LOCK:
+            items = []
+            if os.path.exists(HISTORY_PATH):
+                with open(HISTORY_PATH, "r", encoding="utf-8") as f:
+                    items = json.load(f)
+            items.insert(0, entry)
+            items = items[:200]
+            with open(HISTORY_PATH, "w", encoding="utf-8") as f:
+                json.dump(items, f, indent=2)
     except Exception:
         pass
 
@@ -102,8 +513,124 @@ def _read_history():
     return []
 
 
+# ------------------------------ pipeline ------------------------------
+# /query split in halves (SQL resolution, execution) so /query/batch can run
+# each half on its own pool. Both return a JSON-ready body plus a status.
+
+def _resolve_sql(question: str, tables: list, sql_override: str,
+                 timings: dict, endpoint: str):
+    """Returns (sql, None) or (None, (error_body, status))."""
+    if sql_override:
+        return sql_override, None
+    if not question:
+        return None, ({"ok": False, "error": "Question is required."}, 400)
+    schema_subset = _subset_schema(FULL_SCHEMA, tables)
+    try:
+        with _stage("llm", timings, endpoint):
+            return _generate_cached(question, schema_subset), None
+    except limits.Overloaded:
+        raise
+    except validate.InvalidSQL as e:
+        return None, ({"ok": False, "error": f"Generated SQL does not match the schema: {e}", "sql": e.sql}, 400)
+    except TimeoutError as e:  # gemini.LLMTimeout: deadline spent, retries and hedge included
+        return None, ({"ok": False, "error": f"SQL generation timed out: {e}"}, 504)
+    except Exception as e:
+        return None, ({"ok": False, "error": f"Failed to generate SQL: {e}"}, 500)
+
+def _execute(sql: str, question: str, timings: dict, endpoint: str, info: dict | None = None):
+    try:
+        with _stage("db", timings, endpoint):
+            df = _run_cached(sql)
+    except limits.Overloaded:
+        raise
+    except Exception as e:
+        metrics.DB_ERRORS.inc(endpoint=endpoint)
+        return {"ok": False, "error": f"Database error: {e}", "sql": sql}, 400
+    return _finish(df, sql, question, timings, endpoint, info)
+
+def _finish(df: pd.DataFrame, sql: str, question: str, timings: dict, endpoint: str,
+            info: dict | None = None):
+    """Everything after the fetch (pure CPU work, safe to run in an executor)."""
+    if not isinstance(df, pd.DataFrame):
+        return {"ok": False, "error": "DB adapter did not return a DataFrame."}, 500
+    truncated = bool(df.attrs.get("truncated"))
+    memory_bytes = df.attrs.get("memory_bytes")
+    shared_id = df.attrs.get("result_id")
+    try:
+        with _stage("coerce", timings, endpoint):
+            df = _coerce_numeric(df)
+    except Exception as e:
+        return {"ok": False, "error": f"Database error: {e}", "sql": sql}, 400
+    metrics.ROWS_RETURNED.inc(len(df), endpoint=endpoint)
+    if info is not None:
+        info.update(rows=len(df), columns=len(df.columns), truncated=truncated, memory_bytes=memory_bytes)
+
+    # Column types for charting
+    with _stage("types", timings, endpoint):
+        col_types = {c: _dtype_label(df[c]) for c in df.columns}
+
+    # Persist history
+    with _stage("history", timings, endpoint):
+        _append_history({
+            "ts": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "question": question or "(raw SQL)",
+            "sql": sql
+        })
+
+    with _stage("rows", timings, endpoint):
+        rows = _rows_for_json(df)
+    return {
+        "ok": True,
+        "sql": sql,
+        "result_id": _cache_result(df, sql, shared_id),
+        "columns": list(df.columns),
+        "types": col_types,
+        "rows": rows,
+        # fetch budget hit (db.MAX_RESULT_ROWS / MAX_RESULT_BYTES): rows are a prefix
+        "truncated": truncated,
+        "row_count": len(df),
+        "memory_bytes": memory_bytes,  # server-side frame footprint (typed, compacted)
+    }, 200
+
+def _refine_cached(result_id: str, ops: list, timings: dict, endpoint: str, hit=None):
+    # hit: (frame, sql) when the caller already looked result_id up
+    hit = hit or _cached_result(result_id)
+    if hit is None:
+        return {"ok": False, "error": "Result expired; run the query again."}, 404
+    base, sql = hit
+    try:
+        with _stage("refine", timings, endpoint):
+            df = refine.apply_ops(base, ops)
+    except (ValueError, KeyError, TypeError) as e:
+        return {"ok": False, "error": f"Refine error: {e}"}, 400
+    metrics.ROWS_RETURNED.inc(len(df), endpoint=endpoint)
+    with _stage("types", timings, endpoint):
+        col_types = {c: _dtype_label(df[c]) for c in df.columns}
+    with _stage("rows", timings, endpoint):
+        rows = _rows_for_json(df)
+    return {
+        "ok": True,
+        "sql": sql,
+        "refined": True,
+        "ops": ops,
+        "result_id": _cache_result(df, sql),
+        "columns": list(df.columns),
+        "types": col_types,
+        "rows": rows,
+        "truncated": bool(base.attrs.get("truncated")),  # refined from a partial result
+        "row_count": len(df),
+    }, 200
+
+
 # ------------------------------ routes ------------------------------
 
+@app.errorhandler(limits.Overloaded)
+def _overloaded(e: limits.Overloaded):
+    resp = jsonify({"ok": False, "error": str(e)})
+    resp.status_code = e.status
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp
+
 @app.route("/", methods=["GET"])
 def index():
     return render_template(
@@ -136,56 +663,161 @@ def query():
       "question": "natural language question",   # optional if sql_override present
       "tables": ["sample_data", ...],            # optional
       "sql_override": "SELECT ...",              # optional: run raw SQL directly (SELECT-only)
+      "result_id": "...",                        # optional: previous result, for follow-ups
     }
     """
     payload = request.get_json(force=True, silent=True) or {}
     question = (payload.get("question") or "").strip()
     tables = payload.get("tables") or []
     sql_override = (payload.get("sql_override") or "").strip()
+    result_id = (payload.get("result_id") or "").strip()
+    timings = g.setdefault("timings", {})
 
-    # Build schema subset for generation
-    schema_subset = _subset_schema(FULL_SCHEMA, tables)
+    # 0) Simple follow-ups on the previous result are answered in-process
+    ops = None
+    if result_id and question and not sql_override:
+        hit = _cached_result(result_id)
+        ops = refine.parse_followup(question, list(hit[0].columns)) if hit is not None else None
 
-    # 1) Get SQL: if sql_override provided, use it; else generate with Gemini
-    if sql_override:
-        sql = sql_override
-    else:
-        if not question:
-            return jsonify({"ok": False, "error": "Question is required."}), 400
+    body = None
+    if ops:
+        body, status = _refine_cached(result_id, ops, timings, "query", hit)
+        if status == 400:
+            body = None  # parsed, but this result can't answer it: let the model try
+    if body is None:
+        # 1) Get SQL: if sql_override provided, use it; else generate with Gemini
+        sql, err = _resolve_sql(question, tables, sql_override, timings, "query")
+        if err:
+            return jsonify(err[0]), err[1]
+        # 2) Execute, label column types, persist history
+        g.query_info = {"question": question or "(raw SQL)", "sql": sql}
+        body, status = _execute(sql, question, timings, "query", g.query_info)
+
+    with _stage("serialize"):
+        return jsonify(body), status
+
+
+def _batch_items(payload):
+    """
+    Validated /query/batch items: (items, error). Each item becomes
+    (question, tables, sql_override), or an error message for a malformed
+    item so it fails on its own; a plain string is a question.
+    """
+    if not isinstance(payload, dict):
+        return None, "Body must be a JSON object with an items list."
+    items = payload.get("items")
+    if not isinstance(items, list) or not items:
+        return None, "items must be a non-empty list."
+    if len(items) > BATCH_MAX_ITEMS:
+        return None, f"At most {BATCH_MAX_ITEMS} items per batch."
+    default_tables = payload.get("tables") or []
+    if not isinstance(default_tables, list):
+        return None, "tables must be a list of table names."
+
+    out = []
+    for it in items:
+        if isinstance(it, str):
+            it = {"question": it}
+        if not isinstance(it, dict):
+            out.append("Each item must be a question string or an object with question / sql_override.")
+            continue
+        question, sql_override = it.get("question") or "", it.get("sql_override") or ""
+        tables = it.get("tables") or default_tables
+        if not isinstance(question, str) or not isinstance(sql_override, str):
+            out.append("question and sql_override must be strings.")
+        elif not isinstance(tables, list):
+            out.append("tables must be a list of table names.")
+        else:
+            out.append((question.strip(), tables, sql_override.strip()))
+    return out, None
+
+
+@app.route("/query/batch", methods=["POST"])
+def query_batch():
+    """
+    Body:
+    {
+      "items": [ {"question": "...", "tables": [...]}, {"sql_override": "SELECT ..."}, "a question", ... ],
+      "tables": ["sample_data", ...]             # optional default for items
+    }
+    Generation runs concurrently on the LLM pool; each item's SQL goes to
+    the DB pool as soon as it is ready. Items fail independently.
+    """
+    items, error = _batch_items(request.get_json(force=True, silent=True))
+    if error:
+        return jsonify({"ok": False, "error": error}), 400
+
+    questions = [it[0] if isinstance(it, tuple) else "" for it in items]
+    timings = [{} for _ in items]
+    results: list = [None] * len(items)
+
+    generating = {}
+    for i, it in enumerate(items):
+        if isinstance(it, str):
+            results[i] = ({"ok": False, "error": it}, 400)
+            continue
+        question, tables, sql_override = it
+        generating[_LLM_POOL.submit(_resolve_sql, question, tables, sql_override, timings[i], "query_batch")] = i
+    executing = {}
+    for fut in as_completed(generating):
+        i = generating[fut]
         try:
-            sql = gemini.generate_sql(question, schema_subset, dialect=DIALECT)
+            sql, err = fut.result()
+        except limits.Overloaded as e:
+            err = ({"ok": False, "error": str(e)}, e.status)
         except Exception as e:
-            return jsonify({"ok": False, "error": f"Failed to generate SQL: {e}"}), 500
-
-    # 2) Execute SQL (DataFrame)
-    try:
-        df = db.run_sql(sql)
-        for c in df.columns:
-         if df[c].dtype == "object":
-          df[c] = pd.to_numeric(df[c], errors="ignore")
-       
-        if not isinstance(df, pd.DataFrame):
-            return jsonify({"ok": False, "error": "DB adapter did not return a DataFrame."}), 500
-    except Exception as e:
-        return jsonify({"ok": False, "error": f"Database error: {e}", "sql": sql}), 400
+            err = ({"ok": False, "error": f"Failed to generate SQL: {e}"}, 500)
+        if err:
+            results[i] = err
+            continue
+        executing[_DB_POOL.submit(_execute, sql, questions[i], timings[i], "query_batch")] = i
+    for fut in as_completed(executing):
+        i = executing[fut]
+        try:
+            results[i] = fut.result()
+        except limits.Overloaded as e:
+            results[i] = ({"ok": False, "error": str(e)}, e.status)
+        except Exception as e:
+            results[i] = ({"ok": False, "error": f"Database error: {e}"}, 500)
 
-    # 3) Column types for charting
-    col_types = {c: _dtype_label(df[c]) for c in df.columns}
+    out = []
+    for (body, status), t in zip(results, timings):
+        body["status"] = status
+        body["timings_ms"] = {k: round(v * 1000, 1) for k, v in t.items()}
+        out.append(body)
+    with _stage("serialize"):
+        return jsonify({"ok": True, "items": out})
 
-    # 4) Persist history
-    _append_history({
-        "ts": datetime.utcnow().isoformat(timespec="seconds") + "Z",
-        "question": question or "(raw SQL)",
-        "sql": sql
-    })
 
-    return jsonify({
-        "ok": True,
-        "sql": sql,
-        "columns": list(df.columns),
-        "types": col_types,
-        "rows": _rows_for_json(df),
-    })
+@app.route("/refine", methods=["POST"])
+def refine_result():
+    """
+    Body:
+    {
+      "result_id": "...",                        # from a previous /query or /refine
+      "ops": [ {"op": "filter", "column": "brand", "cmp": "==", "value": "x"},
+               {"op": "sort", "by": "total", "desc": true},
+               {"op": "top", "n": 10, "by": "total"},
+               {"op": "group", "by": ["brand"], "agg": {"total": "sum"}} ],
+      "question": "top 10 by total"              # alternative to ops
+    }
+    """
+    payload = request.get_json(force=True, silent=True) or {}
+    result_id = (payload.get("result_id") or "").strip()
+    ops = payload.get("ops")
+    hit = None
+    if ops and (not isinstance(ops, list) or not all(isinstance(op, dict) for op in ops)):
+        return jsonify({"ok": False, "error": "ops must be a list of objects."}), 400
+    if not ops:
+        hit = _cached_result(result_id)
+        if hit is None:
+            return jsonify({"ok": False, "error": "Result expired; run the query again."}), 404
+        ops = refine.parse_followup(payload.get("question") or "", list(hit[0].columns))
+        if not ops:
+            return jsonify({"ok": False, "error": "Could not understand the refinement."}), 400
+    body, status = _refine_cached(result_id, ops, g.setdefault("timings", {}), "refine_result", hit)
+    with _stage("serialize"):
+        return jsonify(body), status
 
 
 @app.route("/export/csv", methods=["POST"])
@@ -195,20 +827,58 @@ def export_csv():
     if not sql:
         return jsonify({"ok": False, "error": "SQL is required."}), 400
 
+    g.query_info = {"sql": sql}
+    chunks = _stream_csv(sql)
+    failed = _start_stream(chunks, "export_csv")
+    if failed:
+        return failed
+    return Response(
+        chunks,
+        mimetype="text/csv",
+        headers={"Content-Disposition": "attachment; filename=query_results.csv"},
+    )
+
+
+def _stream_csv(sql: str):
+    """CSV in EXPORT_BATCH_ROWS slices straight from a server-side cursor."""
+    with limits.EXPORT.slot(), db.stream_sql(sql) as res:
+        columns = list(res.keys())
+        yield b""
+        header = True
+        for rows in _cursor_batches(res, EXPORT_BATCH_ROWS, "export_csv"):
+            # object columns format each value as itself: no per-batch dtype inference, so
+            # a NULL in one batch can't turn 200 into 200.0 (or midnight timestamps into dates)
+            frame = pd.DataFrame(rows, columns=columns, dtype=object)
+            yield frame.to_csv(index=False, header=header).encode("utf-8")
+            header = False
+        if header:
+            yield pd.DataFrame(columns=columns).to_csv(index=False).encode("utf-8")
+
+
+def _start_stream(chunks, endpoint: str):
+    """
+    Run a streamed export up to its first (empty) chunk: admission and query
+    execution happen there, so overload and SQL errors still get a proper
+    status before the body starts. Returns an error response or None.
+    """
     try:
-        df = db.run_sql(sql)
+        with _stage("db"):
+            next(chunks)
+    except limits.Overloaded:
+        raise
     except Exception as e:
+        metrics.DB_ERRORS.inc(endpoint=endpoint)
         return jsonify({"ok": False, "error": f"Database error: {e}"}), 400
+    return None
 
-    buf = io.StringIO()
-    df.to_csv(buf, index=False)
-    buf.seek(0)
-    return send_file(
-        io.BytesIO(buf.getvalue().encode("utf-8")),
-        as_attachment=True,
-        download_name="query_results.csv",
-        mimetype="text/csv"
-    )
+
+def _cursor_batches(res, size: int, endpoint: str):
+    while True:
+        rows = res.fetchmany(size)
+        if not rows:
+            return
+        metrics.ROWS_RETURNED.inc(len(rows), endpoint=endpoint)
+        yield rows
 
 
 @app.route("/export/excel", methods=["POST"])
@@ -218,21 +888,176 @@ def export_excel():
     if not sql:
         return jsonify({"ok": False, "error": "SQL is required."}), 400
 
+    with limits.EXPORT.slot():
+        return _export_excel(sql)
+
+
+def _export_excel(sql: str):
+    """
+    The workbook is built in memory, so it goes through the fetch budget like
+    /query; a cut-short result says so (X-Result-Truncated and a note sheet)
+    instead of passing for the whole answer. CSV / Parquet stream everything.
+    """
+    g.query_info = {"sql": sql}
     try:
-        df = db.run_sql(sql)
+        with _stage("db"):
+            df = _run_cached(sql)
     except Exception as e:
+        metrics.DB_ERRORS.inc(endpoint="export_excel")
         return jsonify({"ok": False, "error": f"Database error: {e}"}), 400
+    truncated = bool(df.attrs.get("truncated")) or len(df) > EXCEL_MAX_ROWS
+    df = df.iloc[:EXCEL_MAX_ROWS]
+    metrics.ROWS_RETURNED.inc(len(df), endpoint="export_excel")
+    g.query_info.update(rows=len(df), columns=len(df.columns), truncated=truncated)
 
     out = io.BytesIO()
-    with pd.ExcelWriter(out, engine="xlsxwriter") as writer:
-        df.to_excel(writer, index=False, sheet_name="results")
+    with _stage("serialize"):
+        with pd.ExcelWriter(out, engine="xlsxwriter") as writer:
+            df.to_excel(writer, index=False, sheet_name="results")
+            if truncated:
+                pd.DataFrame({"note": [
+                    f"Only the first {len(df)} rows are included (result size limit).",
+                    "Use CSV or Parquet export for the complete result.",
+                ]}).to_excel(writer, index=False, sheet_name="note")
     out.seek(0)
-    return send_file(
+    resp = send_file(
         out,
         as_attachment=True,
         download_name="query_results.xlsx",
         mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     )
+    if truncated:
+        resp.headers["X-Result-Truncated"] = "true"
+    return resp
+
+
+@app.route("/export/parquet", methods=["POST"])
+def export_parquet():
+    payload = request.get_json(force=True, silent=True) or {}
+    sql = (payload.get("sql") or "").strip()
+    if not sql:
+        return jsonify({"ok": False, "error": "SQL is required."}), 400
+    if not export.PARQUET_AVAILABLE:
+        return jsonify({"ok": False, "error": "Parquet export requires pyarrow on the server."}), 501
+
+    g.query_info = {"sql": sql}
+    chunks = _stream_parquet(sql)
+    failed = _start_stream(chunks, "export_parquet")
+    if failed:
+        return failed
+    return Response(
+        chunks,
+        mimetype="application/vnd.apache.parquet",
+        headers={"Content-Disposition": "attachment; filename=query_results.parquet"},
+    )
+
+
+def _stream_parquet(sql: str):
+    """Row groups straight from a server-side cursor; the export slot is held until the last byte."""
+    with limits.EXPORT.slot(), db.stream_sql(sql) as res:
+        columns = list(res.keys())
+        types = export.arrow_types(getattr(res.cursor, "description", None), DIALECT)
+        yield b""
+        batches = _cursor_batches(res, export.PARQUET_ROW_GROUP_ROWS, "export_parquet")
+        yield from export.parquet_chunks(columns, types, batches)
+
+
+@app.route("/saved", methods=["GET", "POST"])
+def saved_queries():
+    """
+    GET: saved queries with freshness (refreshed_at, age_s, next_run, last_error).
+    POST body:
+    {
+      "name": "Morning spends",             # optional
+      "question": "monthly spends by brand",
+      "sql": "SELECT ...",                  # optional: pinned as-is, else generated once now
+      "tables": ["sample_data", ...],       # optional
+      "schedule": "0 7 * * 1-5"             # optional cron (server local time) or @hourly/@daily/...
+    }
+    """
+    if request.method == "GET":
+        return jsonify({"ok": True, "items": [saved.describe(s) for s in saved.list_saved()]})
+    payload = request.get_json(force=True, silent=True) or {}
+    question = (payload.get("question") or "").strip()
+    tables = payload.get("tables") or []
+    if not isinstance(tables, list):
+        return jsonify({"ok": False, "error": "tables must be a list of table names."}), 400
+    sql, err = _resolve_sql(question, tables, (payload.get("sql") or "").strip(), {}, "saved")
+    if err:
+        return jsonify(err[0]), err[1]
+    try:
+        item = saved.add((payload.get("name") or "").strip(), question, sql, tables,
+                         (payload.get("schedule") or "").strip())
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    if item["schedule"]:
+        _DB_POOL.submit(saved.run_due, _refresh_saved)  # warm it now instead of at the next tick
+    return jsonify({"ok": True, "item": saved.describe(item)})
+
+
+@app.route("/saved/<saved_id>", methods=["DELETE"])
+def delete_saved(saved_id: str):
+    if not saved.remove(saved_id):
+        return jsonify({"ok": False, "error": "Saved query not found."}), 404
+    return jsonify({"ok": True})
+
+
+@app.route("/saved/<saved_id>/run", methods=["POST"])
+def run_saved(saved_id: str):
+    """Open a saved query: the precomputed result when the refresher has one, else a live run."""
+    item = saved.get(saved_id)
+    if item is None:
+        return jsonify({"ok": False, "error": "Saved query not found."}), 404
+    sql = item["sql"]
+    timings = g.setdefault("timings", {})
+    g.query_info = {"question": item["question"] or "(saved SQL)", "sql": sql}
+    k = _result_cache_key(sql)
+    try:
+        with _stage("db", timings, "saved"):
+            df = _shared_result(k, "saved_result")
+            metrics.CACHE_LOOKUPS.inc(cache="saved_result", outcome="miss" if df is None else "hit")
+            if df is None:
+                df = _SAVED_FLIGHT.do(k, lambda: _fetch_saved(item)).copy(deep=False)
+                saved.record(saved_id, rows=len(df))
+    except limits.Overloaded:
+        raise
+    except Exception as e:
+        metrics.DB_ERRORS.inc(endpoint="saved")
+        return jsonify({"ok": False, "error": f"Database error: {e}", "sql": sql}), 400
+    body, status = _finish(df, sql, item["question"], timings, "saved", g.query_info)
+    if status == 200:
+        info = saved.describe(item)
+        body.update(saved_id=saved_id, refreshed_at=info["refreshed_at"], age_s=info["age_s"])
+    with _stage("serialize"):
+        return jsonify(body), status
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    # this worker's registry only (see services/metrics.py): one scrape is one worker
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/admin/slow-queries", methods=["GET"])
+def slow_queries():
+    if not profiling.authorized(_admin_token()):
+        return jsonify({"ok": False, "error": "Admin token required."}), 403
+    limit = request.args.get("limit", 100, type=int)
+    return jsonify({"ok": True, "threshold_ms": profiling.SLOW_QUERY_MS, "items": profiling.read_slow(limit)})
+
+
+@app.route("/admin/profiles", methods=["GET"])
+@app.route("/admin/profiles/<profile_id>", methods=["GET"])
+def profiles(profile_id: str = ""):
+    if not profiling.authorized(_admin_token()):
+        return jsonify({"ok": False, "error": "Admin token required."}), 403
+    if not profile_id:
+        return jsonify({"ok": True, "items": profiling.list_profiles()})
+    path = profiling.profile_path(profile_id)
+    if not path:
+        return jsonify({"ok": False, "error": "Profile not found."}), 404
+    return send_file(os.path.abspath(path), as_attachment=True,
+                     download_name=f"profile-{profile_id}.txt", mimetype="text/plain")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,242 @@
+# asgi.py
+"""
+Asyncio serving path:
+
+    uvicorn asgi:app --workers 4
+
+/query and /query/batch are served natively: the LLM call and the database
+round trip are awaited (async Gemini client, async SQLAlchemy engine), and
+pandas work runs in the default executor, so one worker holds hundreds of
+in-flight queries. Every other route is the unchanged Flask app behind an
+ASGI adapter.
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from asgiref.wsgi import WsgiToAsgi
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+
+import app as core
+from services import cache, compress, db, gemini, limits, metrics, params, refine, singleflight, validate
+
+# Bulkheads per worker (the event loop itself is not the limit); configured
+# by ASYNC_LLM_* / ASYNC_DB_* (_CONCURRENCY, _MAX_QUEUE, _QUEUE_TIMEOUT).
+# DB slots also take one of limits.DB, which the mounted Flask routes use, so
+# a worker's database concurrency stays DB_CONCURRENCY across both paths.
+LLM = limits.from_env("llm_async", 64, 256, 10, cls=limits.AsyncBulkhead, prefix="ASYNC_LLM")
+DB = limits.from_env("db_async", limits.DB.limit, 512, 15, cls=limits.AsyncBulkhead, prefix="ASYNC_DB",
+                     shared=limits.DB)
+
+_SQL_FLIGHT = singleflight.AsyncGroup("sql")
+_RESULT_FLIGHT = singleflight.AsyncGroup("result")
+
+
+# ------------------------------ pipeline ------------------------------
+
+async def _generate_cached(question: str, schema_subset: dict) -> str:
+    k = core._sql_cache_key(question, schema_subset)
+    sql = await asyncio.to_thread(cache.get, "sql", k)
+    metrics.CACHE_LOOKUPS.inc(cache="sql", outcome="miss" if sql is None else "hit")
+    if sql is None:
+        sql = await asyncio.to_thread(core._from_shape, question, schema_subset)
+    if sql is None:
+        sql = await _SQL_FLIGHT.do(k, lambda: _generate(question, schema_subset, k))
+    return sql
+
+
+async def _llm(question: str, schema_subset: dict, feedback: str | None = None) -> str:
+    # every model request (hedge and retries too) takes its own LLM slot
+    try:
+        sql = await gemini.generate_sql_async(question, schema_subset, dialect=core.DIALECT,
+                                              feedback=feedback, gate=LLM)
+    except Exception:
+        metrics.LLM_CALLS.inc(outcome="error")
+        raise
+    metrics.LLM_CALLS.inc(outcome="ok")
+    return sql
+
+
+async def _generate(question: str, schema_subset: dict, k: str) -> str:
+    sql = await _llm(question, schema_subset)
+    problem = core._checked(sql, repaired=False)  # microseconds: fine on the loop
+    if problem:
+        sql = await _llm(question, schema_subset, feedback=validate.feedback(sql, problem))
+        problem = core._checked(sql, repaired=True)
+        if problem:
+            raise validate.InvalidSQL(problem, sql)
+    await asyncio.to_thread(cache.set, "sql", k, sql, core.SQL_CACHE_TTL)
+    await asyncio.to_thread(core._remember_shape, question, schema_subset, sql)
+    return sql
+
+
+async def _run_cached(sql: str):
+    k = core._result_cache_key(sql)
+    df = await asyncio.to_thread(core._shared_result, k)
+    metrics.CACHE_LOOKUPS.inc(cache="result", outcome="miss" if df is None else "hit")
+    if df is None:
+        df = (await _RESULT_FLIGHT.do(k, lambda: _fetch(sql, k))).copy(deep=False)
+    return df
+
+
+async def _run(sql: str):
+    template, binds = params.parameterize(sql)
+    async with DB.slot():
+        return await db.run_sql_async(template, binds)
+
+
+async def _fetch(sql: str, k: str):
+    df = await _run(sql)
+    if core._shareable(df):
+        await asyncio.to_thread(core._share_result, k, df, sql, core.RESULT_TTL)
+    return df
+
+
+async def _resolve_sql(question: str, tables: list, sql_override: str, timings: dict, endpoint: str):
+    if sql_override:
+        return sql_override, None
+    if not question:
+        return None, ({"ok": False, "error": "Question is required."}, 400)
+    schema_subset = core._subset_schema(core.FULL_SCHEMA, tables)
+    try:
+        with core._stage("llm", timings, endpoint):
+            return await _generate_cached(question, schema_subset), None
+    except limits.Overloaded:
+        raise
+    except validate.InvalidSQL as e:
+        return None, ({"ok": False, "error": f"Generated SQL does not match the schema: {e}", "sql": e.sql}, 400)
+    except TimeoutError as e:  # gemini.LLMTimeout: deadline spent, retries and hedge included
+        return None, ({"ok": False, "error": f"SQL generation timed out: {e}"}, 504)
+    except Exception as e:
+        return None, ({"ok": False, "error": f"Failed to generate SQL: {e}"}, 500)
+
+
+async def _execute(sql: str, question: str, timings: dict, endpoint: str, info: dict | None = None):
+    try:
+        with core._stage("db", timings, endpoint):
+            df = await _run_cached(sql)
+    except limits.Overloaded:
+        raise
+    except Exception as e:
+        metrics.DB_ERRORS.inc(endpoint=endpoint)
+        return {"ok": False, "error": f"Database error: {e}", "sql": sql}, 400
+    return await asyncio.to_thread(core._finish, df, sql, question, timings, endpoint, info)
+
+
+def _encode(body: dict, encoding: str | None):
+    raw = core.app.json.dumps(body).encode("utf-8")
+    if encoding and len(raw) >= compress.COMPRESS_MIN_BYTES:
+        return raw, compress.compress_bytes(raw, encoding), encoding
+    return raw, raw, None
+
+
+async def _respond(request: Request, body: dict, status: int, timings: dict, t0: float, endpoint: str,
+                   info: dict | None = None) -> Response:
+    encoding = compress.negotiate(request.headers.get("accept-encoding")) if status == 200 else None
+    with core._stage("serialize", timings, endpoint):
+        raw, payload, encoding = await asyncio.to_thread(_encode, body, encoding)
+    total = time.perf_counter() - t0
+    headers = {"Server-Timing": core._server_timing(timings, total), "Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    resp = Response(payload, status_code=status, media_type="application/json", headers=headers)
+    metrics.REQUEST_SECONDS.observe(total, endpoint=endpoint, status=status)
+    metrics.RAW_BYTES.inc(len(raw), endpoint=endpoint, encoding=encoding or "identity")
+    metrics.BYTES_SENT.inc(len(payload), endpoint=endpoint, encoding=encoding or "identity")
+    core._log_if_slow(endpoint, status, total, timings, info)
+    return resp
+
+
+async def _json(request: Request) -> dict:
+    try:
+        payload = await request.json()
+    except Exception:
+        return {}
+    return payload if isinstance(payload, dict) else {}
+
+
+# ------------------------------ routes ------------------------------
+
+async def query(request: Request) -> Response:
+    """Async twin of app.query(); same body, same response."""
+    t0 = time.perf_counter()
+    payload = await _json(request)
+    question = (payload.get("question") or "").strip()
+    tables = payload.get("tables") or []
+    sql_override = (payload.get("sql_override") or "").strip()
+    result_id = (payload.get("result_id") or "").strip()
+    timings: dict = {}
+    info = None
+
+    ops = None
+    if result_id and question and not sql_override:
+        hit = await asyncio.to_thread(core._cached_result, result_id)
+        ops = refine.parse_followup(question, list(hit[0].columns)) if hit is not None else None
+
+    body = None
+    if ops:
+        body, status = await asyncio.to_thread(core._refine_cached, result_id, ops, timings, "query", hit)
+        if status == 400:
+            body = None
+    if body is None:
+        sql, err = await _resolve_sql(question, tables, sql_override, timings, "query")
+        if err:
+            body, status = err
+        else:
+            info = {"question": question or "(raw SQL)", "sql": sql}
+            body, status = await _execute(sql, question, timings, "query", info)
+    return await _respond(request, body, status, timings, t0, "query", info)
+
+
+async def query_batch(request: Request) -> Response:
+    """Async twin of app.query_batch(); items run as concurrent tasks."""
+    t0 = time.perf_counter()
+    items, error = core._batch_items(await _json(request))
+    if error:
+        return await _respond(request, {"ok": False, "error": error}, 400, {}, t0, "query_batch")
+
+    async def one(item):
+        timings: dict = {}
+        try:
+            if isinstance(item, str):
+                body, status = {"ok": False, "error": item}, 400
+            else:
+                question, tables, sql_override = item
+                sql, err = await _resolve_sql(question, tables, sql_override, timings, "query_batch")
+                body, status = err if err else await _execute(sql, question, timings, "query_batch")
+        except limits.Overloaded as e:
+            body, status = {"ok": False, "error": str(e)}, e.status
+        body["status"] = status
+        body["timings_ms"] = {k: round(v * 1000, 1) for k, v in timings.items()}
+        return body
+
+    out = await asyncio.gather(*(one(it) for it in items))
+    return await _respond(request, {"ok": True, "items": list(out)}, 200, {}, t0, "query_batch")
+
+
+async def _overloaded(request: Request, exc: limits.Overloaded) -> Response:
+    body = core.app.json.dumps({"ok": False, "error": str(exc)})
+    return Response(body, status_code=exc.status, media_type="application/json",
+                    headers={"Retry-After": str(exc.retry_after)})
+
+
+@asynccontextmanager
+async def _lifespan(_app):
+    # each uvicorn worker starts its own background threads (never at import)
+    await asyncio.to_thread(core.start_background)
+    yield
+
+
+app = Starlette(
+    lifespan=_lifespan,
+    routes=[
+        Route("/query", query, methods=["POST"]),
+        Route("/query/batch", query_batch, methods=["POST"]),
+        Mount("/", app=WsgiToAsgi(core.app)),
+    ],
+    exception_handlers={limits.Overloaded: _overloaded},
+)
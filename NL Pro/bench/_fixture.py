@@ -0,0 +1,265 @@
+# bench/_fixture.py
+"""
+Shared fixture for the benchmark and load-test scripts:
+- a seeded local SQLite database standing in for the warehouse
+- the tables behind storage/query_history.json, plus the PostgreSQL
+  functions the recorded SQL uses, so the history replays on SQLite
+- a stub `services.gemini` so the app imports without an API key
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import re
+import sqlite3
+import sys
+import time
+import types
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_BRANDS = ["acme", "globex", "initech", "umbrella", "hooli", "stark", "wayne", "wonka"]
+_ENTITIES = ["acme india pvt ltd", "globex media llp", "initech retail ltd", "hooli digital pvt ltd"]
+_SPENDS = [("month", "date"), ("brand_name", "text"), ("legal_entity_name", "text"),
+           ("channel_vendor", "text"), ("team", "text"), ("estimate_no", "int"),
+           ("exchange_rate", "real"), ("budget_spends", "real"), ("actual_spends", "real")]
+
+# tables the recorded workload (storage/query_history.json) queries
+SAMPLE_TABLES: Dict[str, List] = {
+    "sample_data": _SPENDS,
+    "samp__sheet1": _SPENDS,
+    "employee_sample_data__data": [("full_name", "text"), ("department", "text"), ("gender", "text"),
+                                   ("age", "int"), ("annual_salary", "real"), ("hire_date", "date")],
+}
+_TEXT = {
+    "brand_name": _BRANDS + ["landmark cars"],
+    "legal_entity_name": _ENTITIES + [""],
+    "channel_vendor": ["google", "meta", "amazon", "youtube", "times"],
+    "team": ["performance", "brand", "retail"],
+    "department": ["sales", "engineering", "finance", "hr", "marketing"],
+    "gender": ["Male", "Female"],
+}
+
+
+def table_name(width: int) -> str:
+    return f"bench_w{width}"
+
+
+def seed_sqlite(path: str, max_rows: int, widths: List[int]) -> None:
+    """
+    Create one table per width with `max_rows` rows. Columns cycle through
+    int / float / low-cardinality text / ISO date so coercion and labelling
+    see the same mix of types as real results. Existing tables of the right
+    size are reused.
+    """
+    conn = sqlite3.connect(path)
+    rnd = random.Random(42)
+    start = date(2020, 1, 1)
+    for width in widths:
+        name = table_name(width)
+        try:
+            (have,) = conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()
+            if have >= max_rows:
+                continue
+            conn.execute(f'DROP TABLE "{name}"')
+        except sqlite3.OperationalError:
+            pass
+        kinds = ["int", "real", "text", "date"]
+        cols = [(f"c{i}_{kinds[i % 4]}", kinds[i % 4]) for i in range(width)]
+        ddl = ", ".join(f'"{c}" {"TEXT" if k in ("text", "date") else k.upper()}' for c, k in cols)
+        conn.execute(f'CREATE TABLE "{name}" ({ddl})')
+
+        def make(i):
+            out = []
+            for _, k in cols:
+                if k == "int":
+                    out.append(i)
+                elif k == "real":
+                    out.append(round(rnd.random() * 1e6, 2))
+                elif k == "text":
+                    out.append(_BRANDS[rnd.randrange(len(_BRANDS))])
+                else:
+                    out.append((start + timedelta(days=i % 1500)).isoformat())
+            return out
+
+        marks = ",".join("?" * width)
+        batch = 50_000
+        for lo in range(0, max_rows, batch):
+            conn.executemany(
+                f'INSERT INTO "{name}" VALUES ({marks})',
+                (make(i) for i in range(lo, min(max_rows, lo + batch))),
+            )
+        conn.commit()
+    conn.close()
+
+
+def seed_sample_data(path: str, rows: int) -> None:
+    """
+    Create the SAMPLE_TABLES with `rows` rows each (same column names as
+    the recorded workload, synthetic values). Existing tables are reused.
+    """
+    conn = sqlite3.connect(path)
+    rnd = random.Random(7)
+    start = date(2022, 1, 1)
+    for name, cols in SAMPLE_TABLES.items():
+        try:
+            (have,) = conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()
+            if have >= rows:
+                continue
+            conn.execute(f'DROP TABLE "{name}"')
+        except sqlite3.OperationalError:
+            pass
+        ddl = ", ".join(f'"{c}" {"TEXT" if k in ("text", "date") else k.upper()}' for c, k in cols)
+        conn.execute(f'CREATE TABLE "{name}" ({ddl})')
+
+        def make(i):
+            out = []
+            for c, k in cols:
+                if k == "int":
+                    out.append(rnd.randrange(20, 60) if c == "age" else i)
+                elif k == "real":
+                    out.append(round(rnd.random() * 1e5, 2))
+                elif k == "date":
+                    out.append((start + timedelta(days=rnd.randrange(1000))).isoformat())
+                elif c in _TEXT:
+                    out.append(rnd.choice(_TEXT[c]))
+                else:
+                    out.append(f"person {i}")
+            return out
+
+        marks = ",".join("?" * len(cols))
+        conn.executemany(f'INSERT INTO "{name}" VALUES ({marks})', (make(i) for i in range(rows)))
+        conn.commit()
+    conn.close()
+
+
+# -------------------- PostgreSQL SQL on SQLite --------------------
+
+_PG_FORMAT = [("YYYY", "%Y"), ("MM", "%m"), ("DD", "%d"), ("HH24", "%H"), ("MI", "%M"), ("SS", "%S")]
+
+
+def _as_datetime(value):
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(str(value)[:19])
+    except ValueError:
+        return None
+
+
+def _date_trunc(unit, value):
+    d = _as_datetime(value)
+    if d is None:
+        return None
+    unit = (unit or "").lower()
+    if unit == "year":
+        d = d.replace(month=1, day=1)
+    elif unit == "quarter":
+        d = d.replace(month=(d.month - 1) // 3 * 3 + 1, day=1)
+    elif unit == "month":
+        d = d.replace(day=1)
+    elif unit == "week":
+        d = d - timedelta(days=d.weekday())
+    return d.replace(hour=0, minute=0, second=0).isoformat(sep=" ")
+
+
+def _to_char(value, fmt):
+    d = _as_datetime(value)
+    if d is None or fmt is None:
+        return None
+    for pg, py in _PG_FORMAT:
+        fmt = fmt.replace(pg, py)
+    return d.strftime(fmt)
+
+
+def _on_connect(dbapi_conn, _record):
+    if hasattr(dbapi_conn, "create_function"):  # sqlite3 and the aiosqlite adapter
+        dbapi_conn.create_function("DATE_TRUNC", 2, _date_trunc)
+        dbapi_conn.create_function("TO_CHAR", 2, _to_char)
+
+
+def install_pg_functions() -> None:
+    """Register DATE_TRUNC / TO_CHAR on every SQLite connection SQLAlchemy opens."""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    if not event.contains(Engine, "connect", _on_connect):
+        event.listen(Engine, "connect", _on_connect)
+
+
+_EXTRACT = re.compile(r"EXTRACT\(\s*(YEAR|MONTH|DAY)\s+FROM\s+([^()]+?)\s*\)", re.IGNORECASE)
+
+
+def to_sqlite(sql: str) -> str:
+    """Rewrite the PostgreSQL-only syntax in recorded SQL (casts, ILIKE, EXTRACT)."""
+    sql = re.sub(r"::\s*\w+", "", sql)
+    sql = re.sub(r"\bILIKE\b", "LIKE", sql, flags=re.IGNORECASE)
+    fmt = {"year": "%Y", "month": "%m", "day": "%d"}
+    return _EXTRACT.sub(lambda m: f"CAST(strftime('{fmt[m.group(1).lower()]}', {m.group(2)}) AS INTEGER)", sql)
+
+
+def install_stub_gemini(resolve: Callable[[str], str], latency: float = 0.0):
+    """
+    Register a stand-in `services.gemini` whose generate_sql (and
+    generate_sql_async) returns `resolve(question)` after sleeping
+    `latency` seconds. Must run before `app` is imported.
+    """
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+    import services
+
+    stub = types.ModuleType("services.gemini")
+    stub.calls = 0
+
+    def generate_sql(natural_language_query: str,
+                     schema_metadata: Dict[str, List[Dict]],
+                     dialect: str = "postgresql", gate=None, **_) -> str:
+        stub.calls += 1
+        if gate is not None:
+            gate.acquire()  # one model request per LLM slot, as in services.gemini
+        try:
+            if stub.latency:
+                time.sleep(stub.latency)
+        finally:
+            if gate is not None:
+                gate.release()
+        return resolve(natural_language_query)
+
+    async def generate_sql_async(natural_language_query: str,
+                                 schema_metadata: Dict[str, List[Dict]],
+                                 dialect: str = "postgresql", gate=None, **_) -> str:
+        stub.calls += 1
+        if gate is not None:
+            await gate.acquire()
+        try:
+            if stub.latency:
+                await asyncio.sleep(stub.latency)
+        finally:
+            if gate is not None:
+                gate.release()
+        return resolve(natural_language_query)
+
+    stub.latency = latency
+    stub.generate_sql = generate_sql
+    stub.generate_sql_async = generate_sql_async
+    sys.modules["services.gemini"] = stub
+    services.gemini = stub
+    return stub
+
+
+def import_app(database_url: str, history_path: str):
+    """Point the app at the fixture database and a scratch history file, then import it."""
+    os.environ["DATABASE_URL"] = database_url
+    # private shared cache; SQL/result caching off so every call does real work
+    os.environ.setdefault("CACHE_PATH", os.path.join(os.path.dirname(history_path), "cache.sqlite"))
+    os.environ.setdefault("SQL_CACHE_TTL", "0")
+    os.environ.setdefault("RESULT_TTL", "0")
+    os.chdir(APP_DIR)
+    import app as app_module
+
+    app_module.HISTORY_PATH = history_path
+    return app_module
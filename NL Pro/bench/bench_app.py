@@ -0,0 +1,189 @@
+# bench/bench_app.py
+"""
+End-to-end and per-stage benchmarks for the Flask app.
+
+Runs the app in-process against a seeded SQLite fixture with a stubbed
+`gemini.generate_sql`, then measures:
+- /query, /export/csv, /export/excel latency and peak Python memory
+- each /query stage on its own: generation, run_sql, type coercion,
+  _dtype_label, _rows_for_json, _append_history, JSON encoding
+across result sizes and widths. Results are written as JSON so two runs
+can be compared with --compare.
+
+    python bench/bench_app.py --rows 1000,10000,100000,1000000 --widths 4,16
+    python bench/bench_app.py --rows 1000,10000 --compare bench/results/baseline.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import _fixture  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def _timed(fn, repeat: int):
+    """Median wall time of `repeat` calls; returns (seconds, last_result)."""
+    times, out = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times), out
+
+
+def _peak_mb(fn) -> float:
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / 2**20, 2)
+
+
+def bench_stages(app_module, sql: str, question: str, repeat: int) -> dict:
+    gemini, db = app_module.gemini, app_module.db
+    schema = app_module._subset_schema(app_module.FULL_SCHEMA, None)
+    stages = {}
+
+    stages["generate_sql"], _ = _timed(lambda: gemini.generate_sql(question, schema, dialect=app_module.DIALECT), repeat)
+    stages["run_sql"], df = _timed(lambda: db.run_sql(sql), repeat)
+    stages["coerce_numeric"], df = _timed(lambda: app_module._coerce_numeric(df.copy()), repeat)
+    stages["dtype_label"], col_types = _timed(lambda: {c: app_module._dtype_label(df[c]) for c in df.columns}, repeat)
+    stages["rows_for_json"], rows = _timed(lambda: app_module._rows_for_json(df), repeat)
+    entry = {"ts": datetime.utcnow().isoformat(timespec="seconds") + "Z", "question": question, "sql": sql}
+    stages["append_history"], _ = _timed(lambda: app_module._append_history(entry), repeat)
+
+    payload = {"ok": True, "sql": sql, "columns": list(df.columns), "types": col_types, "rows": rows}
+    with app_module.app.app_context():
+        stages["json_encode"], body = _timed(lambda: app_module.app.json.dumps(payload), repeat)
+
+    return {
+        "stages_s": {k: round(v, 6) for k, v in stages.items()},
+        "result_bytes": len(body.encode("utf-8")),
+        "frame_mb": round(df.memory_usage(deep=True).sum() / 2**20, 2),
+    }
+
+
+def bench_endpoints(app_module, sql: str, question: str, repeat: int, excel: bool) -> dict:
+    client = app_module.app.test_client()
+    calls = {
+        "query": lambda: client.post("/query", json={"question": question}),
+        "export_csv": lambda: client.post("/export/csv", json={"sql": sql}),
+    }
+    if excel:
+        calls["export_excel"] = lambda: client.post("/export/excel", json={"sql": sql})
+
+    out = {}
+    for name, call in calls.items():
+        latency, resp = _timed(call, repeat)
+        if resp.status_code != 200:
+            out[name] = {"error": f"HTTP {resp.status_code}: {resp.get_data(as_text=True)[:200]}"}
+            continue
+        out[name] = {
+            "latency_s": round(latency, 6),
+            "peak_mb": _peak_mb(call),
+            "bytes": len(resp.get_data()),
+        }
+    return out
+
+
+def compare(current: dict, baseline_path: str, tolerance: float) -> int:
+    """Print new/old ratios per metric; return the number of regressions."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    old = {(r["rows"], r["width"]): r for r in baseline.get("results", [])}
+    regressions = 0
+    for r in current["results"]:
+        prev = old.get((r["rows"], r["width"]))
+        if not prev:
+            continue
+        pairs = [(f"stage.{k}", v, prev["stages_s"].get(k)) for k, v in r["stages_s"].items()]
+        for ep, m in r["endpoints"].items():
+            for key in ("latency_s", "peak_mb"):
+                pairs.append((f"{ep}.{key}", m.get(key), prev["endpoints"].get(ep, {}).get(key)))
+        for name, new, was in pairs:
+            if not new or not was:
+                continue
+            ratio = new / was
+            flag = "REGRESSION" if ratio > tolerance else ""
+            regressions += bool(flag)
+            print(f"{r['rows']:>9} x {r['width']:<3} {name:<28} {was:>12.6g} -> {new:<12.6g} x{ratio:5.2f} {flag}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", default="1000,10000,100000,1000000", help="comma-separated result sizes")
+    ap.add_argument("--widths", default="4,16", help="comma-separated column counts")
+    ap.add_argument("--repeat", type=int, default=3, help="runs per measurement (median is kept)")
+    ap.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "nlpro_bench.sqlite"))
+    ap.add_argument("--max-excel-rows", type=int, default=200_000, help="skip /export/excel above this size")
+    ap.add_argument("--out", default="", help="result file (default: bench/results/<timestamp>.json)")
+    ap.add_argument("--compare", default="", help="previous result file to compare against")
+    ap.add_argument("--tolerance", type=float, default=1.25, help="ratio above which a metric is a regression")
+    args = ap.parse_args(argv)
+
+    sizes = [int(x) for x in args.rows.split(",") if x.strip()]
+    widths = [int(x) for x in args.widths.split(",") if x.strip()]
+    _fixture.seed_sqlite(args.db, max(sizes), widths)
+
+    # question text doubles as the lookup key for the stub generator
+    stub = _fixture.install_stub_gemini(lambda q: q.split("::", 1)[1])
+    scratch = tempfile.mkdtemp(prefix="nlpro_bench_")
+    app_module = _fixture.import_app(f"sqlite:///{args.db}", os.path.join(scratch, "history.json"))
+
+    try:
+        import xlsxwriter  # noqa: F401
+        have_excel = True
+    except ImportError:
+        have_excel = False
+
+    results = []
+    for width in widths:
+        for n in sizes:
+            sql = f'SELECT * FROM "{_fixture.table_name(width)}" LIMIT {n}'
+            question = f"bench::{sql}"
+            print(f"rows={n} width={width} ...", flush=True)
+            r = {"rows": n, "width": width}
+            r.update(bench_stages(app_module, sql, question, args.repeat))
+            r["endpoints"] = bench_endpoints(app_module, sql, question, args.repeat,
+                                             excel=have_excel and n <= args.max_excel_rows)
+            results.append(r)
+
+    report = {
+        "meta": {
+            "ts": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "python": platform.python_version(),
+            "pandas": app_module.pd.__version__,
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "llm_calls": stub.calls,
+        },
+        "results": results,
+    }
+    out = args.out or os.path.join(RESULTS_DIR, datetime.utcnow().strftime("%Y%m%dT%H%M%SZ") + ".json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"saved {out}")
+
+    if args.compare:
+        return 1 if compare(report, args.compare, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,342 @@
+# bench/load_test.py
+"""
+Concurrent load test with a recorded workload.
+
+Replays the questions in storage/query_history.json against a running app:
+the app is started in a child process on a local SQLite stand-in (the
+history's tables, seeded with synthetic rows; PostgreSQL-only syntax is
+rewritten) with a stub LLM that answers each question with its recorded
+SQL after --llm-latency seconds. Concurrency ramps through --steps; each
+step runs closed-loop clients for --step-seconds and reports throughput,
+p50/p95/p99 latency, error rate and the server's resident memory. A
+timeline of memory and completions is sampled throughout. The highest
+step that stays within --slo-p95 / --slo-errors is reported as capacity.
+
+    python bench/load_test.py --steps 1,4,16,64 --step-seconds 20 --llm-latency 1.5
+    python bench/load_test.py --server asgi --steps 8,32,128
+    python bench/load_test.py --url http://10.0.0.5:8000 --pid 4242   # existing deployment
+
+Against --url the workload's questions are sent as-is (the deployment's own
+LLM and database answer them); --pid enables memory sampling on that host.
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import _fixture  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+HISTORY = os.path.join(_fixture.APP_DIR, "storage", "query_history.json")
+
+
+# ------------------------------ workload ------------------------------
+
+def load_workload(path: str) -> List[Dict[str, str]]:
+    """One {question, sql} per distinct question (the most recent SQL wins)."""
+    with open(path, "r", encoding="utf-8") as f:
+        history = json.load(f)
+    seen: Dict[str, str] = {}
+    for entry in history:  # newest first
+        q, sql = (entry.get("question") or "").strip(), (entry.get("sql") or "").strip()
+        if q and sql and q not in seen:
+            seen[q] = sql
+    return [{"question": q, "sql": sql} for q, sql in seen.items()]
+
+
+def _runnable(workload: List[Dict[str, str]], db_path: str) -> List[Dict[str, str]]:
+    """Drop recorded statements the SQLite stand-in can't run (reported, not counted as errors)."""
+    import sqlite3
+
+    conn = sqlite3.connect(db_path)
+    _fixture._on_connect(conn, None)
+    keep = []
+    for item in workload:
+        try:
+            conn.execute(f"SELECT * FROM ({item['sql'].rstrip(';')}) LIMIT 0")
+            keep.append(item)
+        except sqlite3.Error as e:
+            print(f"skip (stand-in can't run it: {e}): {item['question'][:60]}", flush=True)
+    conn.close()
+    return keep
+
+
+# ------------------------------ server ------------------------------
+
+def serve(args) -> None:
+    """Child process: the app on the SQLite stand-in with the stub LLM."""
+    answers = {w["question"]: w["sql"] for w in json.loads(os.environ["LOAD_TEST_WORKLOAD"])}
+    _fixture.install_stub_gemini(lambda q: answers[q], latency=args.llm_latency)
+    _fixture.install_pg_functions()
+    if args.warm:
+        os.environ.setdefault("SQL_CACHE_TTL", "86400")
+        os.environ.setdefault("RESULT_TTL", "600")
+    app_module = _fixture.import_app(f"sqlite:///{args.db}", os.path.join(args.scratch, "history.json"))
+
+    if args.server == "asgi":
+        import uvicorn
+        import asgi
+
+        uvicorn.run(asgi.app, host="127.0.0.1", port=args.serve_port, log_level="warning")
+    else:
+        import logging
+        from werkzeug.serving import make_server
+
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)  # no per-request access log
+        make_server("127.0.0.1", args.serve_port, app_module.app, threaded=True).serve_forever()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(url: str, proc, timeout: float = 120.0) -> None:
+    parts = urlsplit(url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise SystemExit(f"server exited with code {proc.returncode}")
+        try:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=5)
+            conn.request("GET", "/schema")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise SystemExit(f"server at {url} not ready after {timeout:.0f}s")
+
+
+def rss_mb(pid: int) -> float | None:
+    """Resident memory of `pid` and its children (gunicorn/uvicorn workers)."""
+    try:
+        import psutil
+
+        proc = psutil.Process(pid)
+        procs = [proc] + proc.children(recursive=True)
+        return round(sum(p.memory_info().rss for p in procs) / 2**20, 1)
+    except ImportError:
+        pass
+    except Exception:
+        return None
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+    return None
+
+
+# ------------------------------ load ------------------------------
+
+class _Recorder:
+    """Per-request samples plus running totals for the timeline sampler."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples: List[tuple] = []  # (start, latency_s, status)
+        self.done = self.errors = self.in_flight = 0
+
+    def record(self, start: float, latency: float, status: int) -> None:
+        with self.lock:
+            self.samples.append((start, latency, status))
+            self.done += 1
+            self.errors += status != 200
+            self.in_flight -= 1
+
+
+def _client(url: str, workload, rec: _Recorder, stop: float, seed: int, think: float, timeout: float):
+    parts = urlsplit(url)
+    rnd = random.Random(seed)
+    conn = None
+    while time.monotonic() < stop:
+        body = json.dumps({"question": rnd.choice(workload)["question"]})
+        with rec.lock:
+            rec.in_flight += 1
+        t0 = time.monotonic()
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=timeout)
+            conn.request("POST", "/query", body=body, headers={"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            resp.read()
+            status = resp.status
+        except (OSError, http.client.HTTPException):
+            status = 0  # connection error / timeout
+            conn = None
+        rec.record(t0, time.monotonic() - t0, status)
+        if think:
+            time.sleep(think)
+
+
+def _pct(sorted_values: List[float], p: float) -> float | None:
+    if not sorted_values:
+        return None
+    i = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return round(sorted_values[i] * 1000, 1)
+
+
+def run_step(url: str, workload, concurrency: int, seconds: float, think: float, timeout: float,
+             rec: _Recorder, timeline: list, pid: int | None, t_origin: float, every: float) -> dict:
+    first = len(rec.samples)
+    stop = time.monotonic() + seconds
+    threads = [threading.Thread(target=_client, daemon=True,
+                                args=(url, workload, rec, stop, concurrency * 1000 + i, think, timeout))
+               for i in range(concurrency)]
+    t0 = time.monotonic()
+    for t in threads:
+        t.start()
+    peak = None
+    while any(t.is_alive() for t in threads):
+        time.sleep(every)
+        with rec.lock:
+            point = {"t_s": round(time.monotonic() - t_origin, 1), "concurrency": concurrency,
+                     "done": rec.done, "errors": rec.errors, "in_flight": rec.in_flight}
+        if pid:
+            point["rss_mb"] = rss_mb(pid)
+            peak = max(peak or 0, point["rss_mb"] or 0)
+        timeline.append(point)
+    elapsed = time.monotonic() - t0
+
+    samples = rec.samples[first:]
+    lat = sorted(s[1] for s in samples)
+    ok = sorted(s[1] for s in samples if s[2] == 200)
+    statuses = Counter(s[2] for s in samples if s[2] != 200)
+    return {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else None,
+        "p50_ms": _pct(ok, 50),
+        "p95_ms": _pct(ok, 95),
+        "p99_ms": _pct(ok, 99),
+        "max_ms": round(lat[-1] * 1000, 1) if lat else None,
+        "error_rate": round(sum(statuses.values()) / len(samples), 4) if samples else None,
+        "errors": {str(k): v for k, v in statuses.items()},
+        "rss_mb": peak,
+    }
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--steps", default="1,2,4,8,16,32", help="comma-separated concurrency levels")
+    ap.add_argument("--step-seconds", type=float, default=20.0, help="duration of each step")
+    ap.add_argument("--think", type=float, default=0.0, help="pause between a client's requests (s)")
+    ap.add_argument("--timeout", type=float, default=120.0, help="per-request client timeout (s)")
+    ap.add_argument("--llm-latency", type=float, default=1.0, help="stub LLM latency (s)")
+    ap.add_argument("--rows", type=int, default=50_000, help="rows per seeded stand-in table")
+    ap.add_argument("--server", choices=["wsgi", "asgi"], default="wsgi",
+                    help="threaded Flask server or uvicorn + asgi.app")
+    ap.add_argument("--warm", action="store_true", help="keep SQL/result caching on (default: every call works)")
+    ap.add_argument("--url", default="", help="load an already running deployment instead")
+    ap.add_argument("--pid", type=int, default=0, help="server pid to sample memory from (with --url)")
+    ap.add_argument("--history", default=HISTORY, help="recorded workload")
+    ap.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "nlpro_load.sqlite"))
+    ap.add_argument("--sample-every", type=float, default=1.0, help="timeline sampling interval (s)")
+    ap.add_argument("--slo-p95", type=float, default=5000.0, help="p95 budget in ms for the capacity verdict")
+    ap.add_argument("--slo-errors", type=float, default=0.01, help="error-rate budget for the capacity verdict")
+    ap.add_argument("--out", default="", help="result file (default: bench/results/load-<timestamp>.json)")
+    ap.add_argument("--serve-port", type=int, default=0, help=argparse.SUPPRESS)
+    ap.add_argument("--scratch", default="", help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.serve_port:
+        serve(args)
+        return 0
+
+    workload = load_workload(args.history)
+    proc = None
+    if args.url:
+        url, pid = args.url.rstrip("/"), args.pid or None
+    else:
+        _fixture.seed_sample_data(args.db, args.rows)
+        workload = [dict(w, sql=_fixture.to_sqlite(w["sql"])) for w in workload]
+        workload = _runnable(workload, args.db)
+        port = _free_port()
+        env = dict(os.environ, LOAD_TEST_WORKLOAD=json.dumps(workload))
+        child = [sys.executable, os.path.abspath(__file__), "--serve-port", str(port), "--db", args.db,
+                 "--server", args.server, "--llm-latency", str(args.llm_latency),
+                 "--scratch", tempfile.mkdtemp(prefix="nlpro_load_")] + (["--warm"] if args.warm else [])
+        proc = subprocess.Popen(child, env=env)
+        url, pid = f"http://127.0.0.1:{port}", proc.pid
+    if not workload:
+        raise SystemExit("empty workload")
+
+    steps = [int(x) for x in args.steps.split(",") if x.strip()]
+    rec, timeline, results = _Recorder(), [], []
+    try:
+        _wait_ready(url, proc)
+        t_origin = time.monotonic()
+        idle = {"t_s": 0.0, "concurrency": 0, "done": 0, "errors": 0, "in_flight": 0}
+        if pid:
+            idle["rss_mb"] = rss_mb(pid)
+        timeline.append(idle)
+        for n in steps:
+            print(f"concurrency={n} ...", flush=True)
+            r = run_step(url, workload, n, args.step_seconds, args.think, args.timeout,
+                         rec, timeline, pid, t_origin, args.sample_every)
+            results.append(r)
+            print(f"  {r['throughput_rps']} req/s  p50={r['p50_ms']} p95={r['p95_ms']} p99={r['p99_ms']} ms  "
+                  f"errors={r['error_rate']}  rss={r['rss_mb']} MB", flush=True)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    capacity = None
+    for r in results:  # highest step before the first SLO breach
+        if r["p95_ms"] is None or r["p95_ms"] > args.slo_p95 or (r["error_rate"] or 0) > args.slo_errors:
+            break
+        capacity = r["concurrency"]
+
+    report = {
+        "meta": {
+            "ts": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "target": args.url or f"local {args.server}",
+            "workload": len(workload),
+            "llm_latency_s": None if args.url else args.llm_latency,
+            "rows": None if args.url else args.rows,
+            "warm": args.warm,
+            "step_seconds": args.step_seconds,
+            "think_s": args.think,
+            "slo": {"p95_ms": args.slo_p95, "error_rate": args.slo_errors},
+        },
+        "capacity_concurrency": capacity,
+        "steps": results,
+        "timeline": timeline,
+    }
+    out = args.out or os.path.join(RESULTS_DIR, "load-" + datetime.utcnow().strftime("%Y%m%dT%H%M%SZ") + ".json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"capacity within SLO: {capacity if capacity is not None else 'none'} concurrent clients")
+    print(f"saved {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,24 @@
+# gunicorn.conf.py
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count() * 2 + 1)))
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "4"))
+timeout = int(os.getenv("WEB_TIMEOUT", "120"))
+keepalive = 5
+
+# Import the app (and introspect the schema) once, before forking
+preload_app = True
+
+
+def post_fork(server, worker):
+    import app
+    from services import db
+
+    # pooled DB connections don't survive fork; background threads (hot
+    # tables, replica checks, saved-query scheduler) start here, per worker,
+    # and never in the master
+    db.after_fork()
+    app.start_background()
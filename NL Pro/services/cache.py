@@ -0,0 +1,139 @@
+# services/cache.py
+"""
+Cross-process cache shared by all workers on a host:
+- backed by a local SQLite file in WAL mode (readers never block)
+- values are pickled; every entry has a namespace and a TTL
+- one connection per thread, re-opened after fork
+- every CACHE_PURGE_EVERY writes a process drops expired entries and, past
+  CACHE_MAX_TOTAL_BYTES, the entries closest to expiry
+"""
+
+from __future__ import annotations
+
+import hashlib
+import itertools
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+CACHE_PATH = os.getenv("CACHE_PATH", os.path.join("storage", "cache.sqlite"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 2**20)))  # per entry
+CACHE_MAX_TOTAL_BYTES = int(os.getenv("CACHE_MAX_TOTAL_BYTES", str(1024 * 2**20)))  # whole file
+CACHE_PURGE_EVERY = max(1, int(os.getenv("CACHE_PURGE_EVERY", "200")))  # writes per process
+
+_local = threading.local()
+_writes = itertools.count(1)
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        os.makedirs(os.path.dirname(CACHE_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(CACHE_PATH, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " ns TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL,"
+            " expires REAL NOT NULL, PRIMARY KEY (ns, key))"
+        )
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+
+def key(*parts: Any) -> str:
+    """Stable digest of JSON-serialisable parts (question, schema, dialect, ...)."""
+    raw = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def get(ns: str, k: str) -> Optional[Any]:
+    try:
+        row = _conn().execute(
+            "SELECT value FROM cache WHERE ns = ? AND key = ? AND expires > ?", (ns, k, time.time())
+        ).fetchone()
+        return pickle.loads(row[0]) if row else None
+    except Exception:
+        return None
+
+
+def set(ns: str, k: str, value: Any, ttl: float) -> bool:
+    """Store `value` for `ttl` seconds; oversized or unpicklable values are skipped."""
+    if ttl <= 0:
+        return False
+    try:
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > CACHE_MAX_BYTES:
+            return False
+        _conn().execute(
+            "INSERT OR REPLACE INTO cache (ns, key, value, expires) VALUES (?, ?, ?, ?)",
+            (ns, k, sqlite3.Binary(blob), time.time() + ttl),
+        )
+    except Exception:
+        return False
+    if next(_writes) % CACHE_PURGE_EVERY == 0:
+        trim()
+    return True
+
+
+def claim(ns: str, k: str, ttl: float) -> bool:
+    """
+    Atomically take `k` for `ttl` seconds: True for exactly one caller among
+    all workers until the entry expires (a lease, e.g. one refresh per slot).
+    """
+    try:
+        now = time.time()
+        cur = _conn().execute(
+            "INSERT INTO cache (ns, key, value, expires) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT (ns, key) DO UPDATE SET value = excluded.value, expires = excluded.expires"
+            " WHERE cache.expires <= ?",
+            (ns, k, sqlite3.Binary(pickle.dumps(os.getpid())), now + ttl, now),
+        )
+        return cur.rowcount == 1
+    except Exception:
+        return False
+
+
+def delete(ns: str, k: Optional[str] = None) -> None:
+    try:
+        if k is None:
+            _conn().execute("DELETE FROM cache WHERE ns = ?", (ns,))
+        else:
+            _conn().execute("DELETE FROM cache WHERE ns = ? AND key = ?", (ns, k))
+    except Exception:
+        pass
+
+
+def purge_expired() -> int:
+    try:
+        return _conn().execute("DELETE FROM cache WHERE expires <= ?", (time.time(),)).rowcount
+    except Exception:
+        return 0
+
+
+def trim(max_bytes: Optional[int] = None) -> int:
+    """
+    Drop expired entries, then the soonest-expiring ones until the values
+    total at most `max_bytes` (CACHE_MAX_TOTAL_BYTES); freed pages are reused.
+    """
+    limit = CACHE_MAX_TOTAL_BYTES if max_bytes is None else max_bytes
+    removed = purge_expired()
+    try:
+        conn = _conn()
+        total = conn.execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM cache").fetchone()[0]
+        if total <= limit:
+            return removed
+        doomed = []
+        for ns, k, size in conn.execute("SELECT ns, key, LENGTH(value) FROM cache ORDER BY expires"):
+            if total <= limit:
+                break
+            doomed.append((ns, k))
+            total -= size
+        conn.executemany("DELETE FROM cache WHERE ns = ? AND key = ?", doomed)
+        return removed + len(doomed)
+    except Exception:
+        return removed
@@ -0,0 +1,118 @@
+# services/compress.py
+"""
+Content-negotiated response compression:
+- zstd (if the zstandard package is installed) or gzip, picked from
+  Accept-Encoding with q-values honoured
+- incremental: streamed bodies are compressed chunk by chunk and each
+  compressed chunk is flushed right away, so clients see bytes early
+- buffered bodies below COMPRESS_MIN_BYTES are sent as-is
+"""
+
+from __future__ import annotations
+
+import os
+import zlib
+from typing import Iterable, Iterator, Optional
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))     # 1 (fast) .. 9 (small)
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", "3"))     # 1 .. 19
+COMPRESS_ENCODINGS = [e.strip() for e in os.getenv("COMPRESS_ENCODINGS", "zstd,gzip").split(",") if e.strip()]
+
+# Already-compressed formats (xlsx, parquet, images) are left alone
+_COMPRESSIBLE = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+
+def compressible(mimetype: str | None) -> bool:
+    return bool(mimetype) and mimetype.startswith(_COMPRESSIBLE)
+
+
+def _supported(encoding: str) -> bool:
+    return encoding == "gzip" or (encoding == "zstd" and zstandard is not None)
+
+
+def negotiate(accept_encoding: str | None) -> Optional[str]:
+    """Best encoding the client accepts, in server preference order (None = identity)."""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for p in params.split(";"):
+            k, _, v = p.strip().partition("=")
+            if k == "q":
+                try:
+                    q = float(v)
+                except ValueError:
+                    q = 0.0
+        accepted[name] = q
+    best, best_q = None, 0.0
+    for enc in COMPRESS_ENCODINGS:
+        q = accepted.get(enc, accepted.get("*", 0.0))
+        if q > best_q and _supported(enc):
+            best, best_q = enc, q
+    return best
+
+
+class Compressor:
+    """Incremental compressor; compress() returns whatever is ready to send."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        elif encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        else:
+            raise ValueError(f"Unsupported encoding: {encoding}")
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        out = self._obj.compress(data)
+        if flush:
+            if self.encoding == "gzip":
+                out += self._obj.flush(zlib.Z_SYNC_FLUSH)
+            else:
+                out += self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return out
+
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+
+def compress_bytes(data: bytes, encoding: str) -> bytes:
+    c = Compressor(encoding)
+    return c.compress(data) + c.finish()
+
+
+def compress_stream(chunks: Iterable[bytes], encoding: str, on_chunk=None) -> Iterator[bytes]:
+    """
+    Compress a streamed body chunk by chunk. `on_chunk(raw, sent)` is called
+    with the byte counts for metrics.
+    """
+    c = Compressor(encoding)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            if not chunk:
+                continue
+            out = c.compress(chunk, flush=True)
+            if on_chunk:
+                on_chunk(len(chunk), len(out))
+            if out:
+                yield out
+        tail = c.finish()
+        if on_chunk:
+            on_chunk(0, len(tail))
+        yield tail
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
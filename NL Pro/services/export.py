@@ -0,0 +1,212 @@
+# services/export.py
+"""
+Streaming Parquet export:
+- rows come from a server-side cursor in batches; each batch becomes one
+  row group, so memory stays bounded by PARQUET_ROW_GROUP_ROWS
+- column types come from the cursor description where the driver reports
+  them (PostgreSQL type OIDs), otherwise from the first batch; later batches
+  are cast to those types (Decimal -> float for unconstrained NUMERIC); a
+  column that is all NULL so far is typed from the first batch that has a
+  value, holding back at most PARQUET_INFER_BATCHES batches, else text;
+  inferred integers are written as float64 (exact up to 2**53), since a
+  driver without type metadata may hand a later batch 2.5 in the same column
+- encoded bytes are handed out as soon as each row group is written
+pyarrow is optional; without it PARQUET_AVAILABLE is False.
+"""
+
+from __future__ import annotations
+
+import os
+from decimal import Decimal
+from typing import Dict, Iterable, Iterator, List, Sequence
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:  # pragma: no cover - optional dependency
+    pa = pc = pq = None
+    PARQUET_AVAILABLE = False
+
+PARQUET_ROW_GROUP_ROWS = int(os.getenv("PARQUET_ROW_GROUP_ROWS", "50000"))
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")  # snappy | zstd | gzip | none
+# batches held back while an inferred column has only NULLs (its type is still unknown)
+PARQUET_INFER_BATCHES = int(os.getenv("PARQUET_INFER_BATCHES", "4"))
+
+# PostgreSQL type OIDs (psycopg2 / asyncpg report these as type_code)
+_PG_TYPES: Dict[int, str] = {
+    16: "bool", 20: "int64", 21: "int16", 23: "int32", 26: "int64",
+    700: "float32", 701: "float64", 1700: "numeric",
+    18: "string", 19: "string", 25: "string", 1042: "string", 1043: "string",
+    114: "string", 3802: "string", 2950: "string",
+    17: "binary", 1082: "date", 1083: "time", 1114: "timestamp", 1184: "timestamptz",
+}
+
+
+def _pg_type(code, precision, scale):
+    name = _PG_TYPES.get(code) if isinstance(code, int) else None
+    if name is None:
+        return None
+    if name == "numeric":
+        # unconstrained NUMERIC (AVG, SUM(bigint), ::numeric) has no precision; the
+        # Decimal values are converted to float64 in _column()
+        if precision and 0 < precision <= 38 and scale is not None and scale >= 0:
+            return pa.decimal128(precision, scale)
+        return pa.float64()
+    return {
+        "bool": pa.bool_(), "int16": pa.int16(), "int32": pa.int32(), "int64": pa.int64(),
+        "float32": pa.float32(), "float64": pa.float64(), "string": pa.string(),
+        "binary": pa.binary(), "date": pa.date32(), "time": pa.time64("us"),
+        "timestamp": pa.timestamp("us"), "timestamptz": pa.timestamp("us", tz="UTC"),
+    }[name]
+
+
+def arrow_types(description: Sequence | None, dialect: str) -> List:
+    """Arrow type per result column from DB-API cursor metadata (None = infer)."""
+    if not description:
+        return []
+    if not dialect.startswith("postgres"):
+        return [None] * len(description)
+    return [_pg_type(d[1], d[4], d[5]) if len(d) > 5 else None for d in description]
+
+
+_EXACT_INT = 2 ** 53  # largest magnitude float64 holds exactly
+
+
+def _widen(t, exact: bool = True):
+    # inference from the first batches must hold for every later batch;
+    # exact: every integer seen so far survives a float64 round trip
+    if pa.types.is_null(t):
+        return pa.string()
+    if pa.types.is_decimal(t):
+        return pa.decimal128(38, max(t.scale, 9))
+    if pa.types.is_integer(t):
+        return pa.float64() if exact else pa.int64()  # ids beyond 2**53 stay integers
+    return t
+
+
+def _coerce(col: Sequence, t) -> list:
+    """Values of one column converted to fit Arrow type `t` (None stays None)."""
+    if pa.types.is_floating(t):
+        return [None if v is None else float(v) for v in col]
+    if pa.types.is_string(t) or pa.types.is_large_string(t):
+        return [v if v is None or isinstance(v, str) else str(v) for v in col]
+    if pa.types.is_decimal(t):
+        q = Decimal(1).scaleb(-t.scale)
+        return [v if v is None else Decimal(v).quantize(q) for v in col]
+    if pa.types.is_integer(t):
+        return [v if v is None or isinstance(v, int) else int(v) if float(v).is_integer() else v for v in col]
+    return list(col)
+
+
+def _column(col: Sequence, t):
+    if t is None:
+        return pa.array(col, from_pandas=True)
+    try:
+        return pa.array(col, type=t, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # e.g. Decimal into float64, or numbers into a column first seen all-NULL
+        return pa.array(_coerce(col, t), type=t, from_pandas=True)
+
+
+def _batch(columns: List[str], types: List, rows: List[Sequence]):
+    values = list(zip(*rows)) if rows else [()] * len(columns)
+    arrays = [_column(col, types[i]) for i, col in enumerate(values)]
+    return pa.Table.from_arrays(arrays, names=list(columns))
+
+
+def _infer(columns: List[str], types: List, held: List[List[Sequence]], final: bool = False):
+    """Schema for the held batches; None while an inferred column is still all NULL (unless final)."""
+    seen = [pa.null()] * len(columns)
+    exact = [True] * len(columns)
+    for rows in held:
+        table = _batch(columns, types, rows)
+        for i, t in enumerate(table.schema.types):
+            if pa.types.is_null(seen[i]) or (pa.types.is_integer(seen[i]) and pa.types.is_floating(t)):
+                seen[i] = t
+            if pa.types.is_integer(t) and exact[i]:
+                lo_hi = pc.min_max(table.column(i)).values()
+                exact[i] = all(v is None or -_EXACT_INT <= v <= _EXACT_INT for v in (x.as_py() for x in lo_hi))
+    if not final and any(t is None and pa.types.is_null(i) for t, i in zip(types, seen)):
+        return None
+    return pa.schema([pa.field(n, t if t is not None else _widen(i, x))
+                      for n, t, i, x in zip(columns, types, seen, exact)])
+
+
+class _Sink:
+    """Write-only file whose bytes are taken as soon as they are written."""
+
+    closed = False
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._pos = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def drain(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts.clear()
+        return out
+
+
+def parquet_chunks(columns: List[str], types: List, batches: Iterable[List[Sequence]]) -> Iterator[bytes]:
+    """
+    Encode row batches as a Parquet file, yielding bytes per row group.
+    `types` holds an Arrow type or None per column (see arrow_types()).
+    """
+    if not PARQUET_AVAILABLE:
+        raise RuntimeError("Parquet export requires pyarrow.")
+    types = list(types) or [None] * len(columns)
+    sink = _Sink()
+    writer = None
+    compression = None if PARQUET_COMPRESSION == "none" else PARQUET_COMPRESSION
+    held: List[List[Sequence]] = []  # batches waiting for an all-NULL column's type
+
+    def flush(parts, final=False):
+        nonlocal writer, types
+        if writer is None:
+            schema = _infer(columns, types, parts, final)
+            if schema is None:
+                return
+            types = list(schema.types)
+            writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression=compression)
+        for part in parts:
+            writer.write_table(_batch(columns, types, part), row_group_size=len(part))
+        parts.clear()
+
+    try:
+        for rows in batches:
+            if not rows:
+                continue
+            held.append(rows)
+            flush(held, final=len(held) >= PARQUET_INFER_BATCHES)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+        # leftovers, or an empty result: still a valid file with the column names
+        flush(held, final=True)
+    finally:
+        if writer is not None:
+            writer.close()
+    yield sink.drain()
@@ -0,0 +1,98 @@
+# services/frames.py
+"""
+Compact result frames:
+- each fetched chunk is turned into typed column arrays right away, so Row
+  tuples and all-object columns never pile up for the whole result
+- ints stay int64 (float64 when NULLs are present), Decimals are converted
+  to float64 in bulk, everything else keeps pandas' own inference
+- once all chunks are in: integers are downcast to the smallest type that
+  holds them and low-cardinality text becomes categorical
+- the final in-memory footprint is reported as df.attrs["memory_bytes"]
+"""
+
+from __future__ import annotations
+
+import os
+from decimal import Decimal
+from typing import List, Sequence
+
+import numpy as np
+import pandas as pd
+
+# text columns with at most this share of distinct values become categoricals
+CATEGORY_MAX_RATIO = float(os.getenv("CATEGORY_MAX_RATIO", "0.5"))
+CATEGORY_MIN_ROWS = int(os.getenv("CATEGORY_MIN_ROWS", "64"))
+
+_NONE = type(None)
+_FLOATISH = {int, float, Decimal}
+
+
+def _typed(values: Sequence) -> pd.Series:
+    kinds = set(map(type, values))
+    has_null = _NONE in kinds
+    kinds.discard(_NONE)
+    try:
+        if kinds == {int}:
+            return pd.Series(np.array(values, dtype=np.float64 if has_null else np.int64))
+        if kinds and kinds <= _FLOATISH:
+            # Decimal / mixed numerics: one bulk float conversion, NULL -> NaN
+            return pd.Series(np.array(values, dtype=np.float64))
+    except (OverflowError, TypeError, ValueError):
+        pass  # e.g. integers beyond int64: keep them as objects
+    return pd.Series(list(values))
+
+
+def chunk_columns(rows: List[Sequence], width: int) -> List[pd.Series]:
+    """Typed column Series for one fetched chunk."""
+    if not rows:
+        return [pd.Series([], dtype=object) for _ in range(width)]
+    return [_typed(col) for col in zip(*rows)]
+
+
+def nbytes(columns: List[pd.Series]) -> int:
+    return int(sum(s.memory_usage(index=False, deep=True) for s in columns))
+
+
+def _compact(s: pd.Series) -> pd.Series:
+    if pd.api.types.is_integer_dtype(s.dtype) and not pd.api.types.is_bool_dtype(s.dtype):
+        return pd.to_numeric(s, downcast="integer")
+    text = isinstance(s.dtype, pd.StringDtype) or s.dtype == object
+    if text and len(s) >= CATEGORY_MIN_ROWS:
+        non_null = s.dropna()
+        if s.dtype == object and not non_null.map(type).eq(str).all():
+            return s
+        if non_null.nunique() <= CATEGORY_MAX_RATIO * len(s):
+            return s.astype("category")
+    return s
+
+
+def build(chunks: List[List[pd.Series]], keys: Sequence[str]) -> pd.DataFrame:
+    """Concatenate per-chunk columns into one compact DataFrame."""
+    keys = list(keys)
+    if not chunks:
+        df = pd.DataFrame(columns=keys)
+    else:
+        cols = {}
+        for i, k in enumerate(keys):
+            parts = [c[i] for c in chunks]
+            s = parts[0] if len(parts) == 1 else pd.concat(parts, ignore_index=True)
+            cols[i] = _compact(s)
+        df = pd.DataFrame(cols)
+        df.columns = keys  # duplicate names (e.g. two "count" columns) survive
+    df.attrs["memory_bytes"] = int(df.memory_usage(index=True, deep=True).sum())
+    return df
+
+
+def concat(parts: List[pd.DataFrame]) -> pd.DataFrame:
+    """Row-wise concatenation of frames with the same columns, compacted again."""
+    keys = list(parts[0].columns)
+    chunks = []
+    for df in parts:
+        cols = []
+        for i in range(len(keys)):
+            s = df.iloc[:, i].reset_index(drop=True)
+            if isinstance(s.dtype, pd.CategoricalDtype):
+                s = s.astype(s.cat.categories.dtype)  # categories differ per part; _compact re-derives them
+            cols.append(s)
+        chunks.append(cols)
+    return build(chunks, keys)
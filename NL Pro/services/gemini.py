@@ -584,32 +584,132 @@ Gemini-powered SQL generator with:
 - time-bucket rewrite (monthly/weekly/daily/quarterly/yearly) → period,value
   (period is an ISO date string 'YYYY-MM-DD', never a timestamp)
 - keyword-glue sanitizer to fix tiny spacing errors
+- every call bounded by LLM_DEADLINE_SECONDS; a hedge request (optionally to
+  a cheaper GEMINI_HEDGE_MODEL) fires when the first hasn't answered within
+  a percentile of recent latencies, and the first valid SQL wins
+- transient errors (429/5xx, timeouts) retried with jittered backoff
+- LLM_BACKEND=stub swaps the model for a local stand-in with configurable
+  latency, tail latency and error rate (no API key needed)
 """
 
 from __future__ import annotations
 
+import asyncio
 import os
+import random
 import re
-from typing import Dict, List
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List
 
-import google.generativeai as genai
+from services import limits, metrics
 
+try:
+    import google.generativeai as genai
+except ImportError:
+    genai = None
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini").lower()  # "gemini" or "stub"
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
-if not GEMINI_API_KEY:
-    raise RuntimeError("GEMINI_API_KEY is not configured.")
-genai.configure(api_key=GEMINI_API_KEY)
+if LLM_BACKEND == "gemini":
+    if genai is None:
+        raise RuntimeError("google-generativeai is not installed (pip install google-generativeai).")
+    if not GEMINI_API_KEY:
+        raise RuntimeError("GEMINI_API_KEY is not configured.")
+    genai.configure(api_key=GEMINI_API_KEY)
 
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
-
-_model = genai.GenerativeModel(
-    model_name=GEMINI_MODEL,
-    generation_config={
-        "temperature": 0.15,
-        "top_p": 0.9,
-        "top_k": 32,
-        "max_output_tokens": 512,
-    },
-)
+GEMINI_HEDGE_MODEL = os.getenv("GEMINI_HEDGE_MODEL", "") or GEMINI_MODEL
+
+_GENERATION_CONFIG = {
+    "temperature": 0.15,
+    "top_p": 0.9,
+    "top_k": 32,
+    "max_output_tokens": 512,
+}
+
+# Whole generate_sql call, retries and hedges included
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "30"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+LLM_BACKOFF_SECONDS = float(os.getenv("LLM_BACKOFF_SECONDS", "0.5"))  # first retry waits up to this
+# Hedging: delay = LLM_HEDGE_PERCENTILE of the last LLM_HEDGE_WINDOW latencies
+# (LLM_HEDGE_DELAY until LLM_HEDGE_MIN_SAMPLES are in), never below LLM_HEDGE_MIN_DELAY
+LLM_HEDGE = os.getenv("LLM_HEDGE", "1") == "1"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "3"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_WINDOW = int(os.getenv("LLM_HEDGE_WINDOW", "200"))
+
+# Blocking calls run here so the caller can stop waiting at the deadline
+# (threads start lazily, so creating the pool before fork is safe)
+_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_POOL_WORKERS", "32")), thread_name_prefix="llm")
+
+
+class LLMTimeout(TimeoutError):
+    """No usable answer from the model within LLM_DEADLINE_SECONDS."""
+
+
+# -------------------- backends --------------------
+
+class _GeminiBackend:
+    def __init__(self, model_name: str):
+        self.name = model_name
+        self.model = genai.GenerativeModel(model_name=model_name, generation_config=_GENERATION_CONFIG)
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        resp = self.model.generate_content(prompt, request_options={"timeout": timeout})
+        return resp.text or ""
+
+    async def generate_async(self, prompt: str, timeout: float) -> str:
+        resp = await self.model.generate_content_async(prompt, request_options={"timeout": timeout})
+        return resp.text or ""
+
+
+class _StubBackend:
+    """
+    Local stand-in for tests and load runs: answers LLM_STUB_SQL after
+    LLM_STUB_LATENCY seconds; LLM_STUB_TAIL_RATE of calls take
+    LLM_STUB_TAIL_LATENCY instead, LLM_STUB_ERROR_RATE fail with a 503.
+    """
+
+    def __init__(self, model_name: str):
+        self.name = model_name
+        self.sql = os.getenv("LLM_STUB_SQL", "SELECT 1")
+        self.latency = float(os.getenv("LLM_STUB_LATENCY", "0.05"))
+        self.tail_rate = float(os.getenv("LLM_STUB_TAIL_RATE", "0"))
+        self.tail_latency = float(os.getenv("LLM_STUB_TAIL_LATENCY", "30"))
+        self.error_rate = float(os.getenv("LLM_STUB_ERROR_RATE", "0"))
+        self.calls = 0
+
+    def _draw(self):
+        self.calls += 1
+        slow = random.random() < self.tail_rate
+        return (self.tail_latency if slow else self.latency), random.random() < self.error_rate
+
+    def _answer(self, delay: float, fail: bool, timeout: float) -> str:
+        if delay > timeout:
+            raise TimeoutError(f"stub {self.name} timed out after {timeout:.1f}s")
+        if fail:
+            raise RuntimeError(f"503 Service Unavailable (stub {self.name})")
+        return self.sql
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        delay, fail = self._draw()
+        time.sleep(min(delay, timeout))
+        return self._answer(delay, fail, timeout)
+
+    async def generate_async(self, prompt: str, timeout: float) -> str:
+        delay, fail = self._draw()
+        await asyncio.sleep(min(delay, timeout))
+        return self._answer(delay, fail, timeout)
+
+
+_Backend = _StubBackend if LLM_BACKEND == "stub" else _GeminiBackend
+_PRIMARY = _Backend(GEMINI_MODEL)
+_HEDGE = _PRIMARY if GEMINI_HEDGE_MODEL == GEMINI_MODEL else _Backend(GEMINI_HEDGE_MODEL)
 
 # -------------------- prompt helpers --------------------
 
@@ -662,7 +762,10 @@ RULES
 {bucket_rule}
 """.strip()
 
-def _build_prompt(question: str, schema_metadata: Dict[str, List[Dict]], dialect: str) -> str:
+def _build_prompt(question: str, schema_metadata: Dict[str, List[Dict]], dialect: str,
+                  feedback: str | None = None) -> str:
+    # feedback: why the previous attempt was rejected (one repair round)
+    repair = f"\n\nFEEDBACK\n{feedback}" if feedback else ""
     return f"""
 {_build_rules_text(dialect)}
 
@@ -670,7 +773,7 @@ SCHEMA
 {_format_schema_prompt(schema_metadata)}
 
 QUESTION
-{question}
+{question}{repair}
 
 Return a single SQL SELECT statement using the schema above. No commentary.
 """.strip()
@@ -821,19 +924,10 @@ def _apply_time_bucket_if_needed(sql: str,
 
     return new_sql
 
-# -------------------- public API --------------------
-
-def generate_sql(natural_language_query: str,
+def _postprocess(raw: str,
+                 natural_language_query: str,
                  schema_metadata: Dict[str, List[Dict]],
-                 dialect: str = "postgresql") -> str:
-    prompt = _build_prompt(natural_language_query, schema_metadata, dialect)
-
-    try:
-        resp = _model.generate_content(prompt)
-        raw = resp.text or ""
-    except Exception as e:
-        raise RuntimeError(f"Gemini API error: {e}")
-
+                 dialect: str) -> str:
     sql = _clean_sql(raw)
     sql = _wrap_sum_with_coalesce(sql)
 
@@ -853,3 +947,225 @@ def generate_sql(natural_language_query: str,
 
     sql = _clean_sql(sql)  # final spacing/cleanup
     return sql
+
+# -------------------- deadline, hedging, retries --------------------
+
+_latencies: deque = deque(maxlen=LLM_HEDGE_WINDOW)  # seconds, successful primary calls
+_latencies_lock = threading.Lock()
+
+_TRANSIENT = re.compile(
+    r"(?i)\b(429|500|502|503|504)\b|resource.?exhausted|unavailable|deadline|timed?.?out|temporar|connection"
+)
+
+
+def _observe(seconds: float) -> None:
+    with _latencies_lock:
+        _latencies.append(seconds)
+
+
+def hedge_delay() -> float:
+    """Seconds to wait for the primary request before hedging."""
+    with _latencies_lock:
+        xs = sorted(_latencies)
+    if len(xs) < LLM_HEDGE_MIN_SAMPLES:
+        return LLM_HEDGE_DELAY
+    return max(LLM_HEDGE_MIN_DELAY, xs[min(len(xs) - 1, int(len(xs) * LLM_HEDGE_PERCENTILE / 100))])
+
+
+def _valid(sql: str) -> bool:
+    return bool(re.match(r"(?is)\s*(select|with)\b", sql or ""))
+
+
+def _transient(e: Exception) -> bool:
+    return isinstance(e, (TimeoutError, ConnectionError)) or bool(_TRANSIENT.search(f"{type(e).__name__} {e}"))
+
+
+def _attempt(backend, prompt: str, timeout: float, post: Callable[[str], str]) -> str:
+    t0 = time.monotonic()
+    raw = backend.generate(prompt, timeout)
+    if backend is _PRIMARY:
+        _observe(time.monotonic() - t0)  # also when the hedge already won: keeps the tail honest
+    return post(raw)
+
+
+async def _attempt_async(backend, prompt: str, timeout: float, post: Callable[[str], str]) -> str:
+    t0 = time.monotonic()
+    raw = await backend.generate_async(prompt, timeout)
+    if backend is _PRIMARY:
+        _observe(time.monotonic() - t0)
+    return post(raw)
+
+
+def _timeout(why: str = "") -> LLMTimeout:
+    return LLMTimeout(f"no answer from the model within {LLM_DEADLINE_SECONDS:g}s{why}")
+
+
+def _hedged(prompt: str, post: Callable[[str], str], deadline: float, gate=None) -> str:
+    """
+    One primary request, plus a hedge if it is still pending after
+    hedge_delay(). Returns the first valid SQL; an invalid answer is kept
+    as a fallback (the caller's validation/repair handles it).
+    Each request holds a slot of `gate` (a limits.Bulkhead) while it runs;
+    the hedge doesn't queue for one and is skipped when none is free.
+    """
+    pending: dict = {}
+
+    def submit(backend, role: str) -> None:
+        if gate is not None and not gate.acquire(blocking=role == "primary"):
+            metrics.LLM_HEDGES.inc(outcome="skipped")
+            return
+        left = deadline - time.monotonic()
+        if left <= 0:  # the deadline passed while queued for a slot
+            if gate is not None:
+                gate.release()
+            raise _timeout()
+        f = _POOL.submit(_attempt, backend, prompt, left, post)
+        if gate is not None:
+            f.add_done_callback(lambda _: gate.release())  # stragglers keep their slot until they finish
+        pending[f] = role
+
+    submit(_PRIMARY, "primary")
+    hedge_at = time.monotonic() + hedge_delay() if LLM_HEDGE else None
+    fallback, error = None, None
+    while pending and time.monotonic() < deadline:
+        until = deadline if hedge_at is None else min(deadline, hedge_at)
+        done, _ = wait(pending, timeout=max(0.0, until - time.monotonic()), return_when=FIRST_COMPLETED)
+        for f in done:
+            role = pending.pop(f)
+            try:
+                sql = f.result()
+            except Exception as e:
+                error = e
+                continue
+            if _valid(sql):
+                if role == "hedge":
+                    metrics.LLM_HEDGES.inc(outcome="won")
+                return sql
+            fallback = sql if fallback is None else fallback
+        if pending and hedge_at is not None and time.monotonic() >= hedge_at:
+            hedge_at = None
+            if time.monotonic() < deadline:
+                metrics.LLM_HEDGES.inc(outcome="fired")
+                submit(_HEDGE, "hedge")
+    if fallback is not None:
+        return fallback
+    if pending or time.monotonic() >= deadline:
+        # stragglers finish in the pool (bounded by their own timeout); a request
+        # that timed out just before wait() gave up is the same deadline
+        raise _timeout()
+    raise error
+
+
+async def _hedged_async(prompt: str, post: Callable[[str], str], deadline: float, gate=None) -> str:
+    """Async twin of _hedged() (gate: a limits.AsyncBulkhead); losing requests are cancelled."""
+    pending: dict = {}
+
+    async def submit(backend, role: str) -> None:
+        if gate is not None and not await gate.acquire(blocking=role == "primary"):
+            metrics.LLM_HEDGES.inc(outcome="skipped")
+            return
+        left = deadline - time.monotonic()
+        if left <= 0:
+            if gate is not None:
+                gate.release()
+            raise _timeout()
+        task = asyncio.ensure_future(_attempt_async(backend, prompt, left, post))
+        if gate is not None:
+            task.add_done_callback(lambda _: gate.release())
+        pending[task] = role
+
+    await submit(_PRIMARY, "primary")
+    hedge_at = time.monotonic() + hedge_delay() if LLM_HEDGE else None
+    fallback, error = None, None
+    try:
+        while pending and time.monotonic() < deadline:
+            until = deadline if hedge_at is None else min(deadline, hedge_at)
+            done, _ = await asyncio.wait(pending, timeout=max(0.0, until - time.monotonic()),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            for f in done:
+                role = pending.pop(f)
+                try:
+                    sql = f.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if _valid(sql):
+                    if role == "hedge":
+                        metrics.LLM_HEDGES.inc(outcome="won")
+                    return sql
+                fallback = sql if fallback is None else fallback
+            if pending and hedge_at is not None and time.monotonic() >= hedge_at:
+                hedge_at = None
+                if time.monotonic() < deadline:
+                    metrics.LLM_HEDGES.inc(outcome="fired")
+                    await submit(_HEDGE, "hedge")
+    finally:
+        for f in pending:
+            f.cancel()
+    if fallback is not None:
+        return fallback
+    if pending or time.monotonic() >= deadline:
+        raise _timeout()
+    raise error
+
+
+def _backoff(attempt: int, e: Exception, deadline: float) -> float:
+    """Pause before retry `attempt` (0-based), or raise when `e` shouldn't be retried."""
+    if not _transient(e):
+        raise RuntimeError(f"Gemini API error: {e}") from e
+    pause = random.uniform(0, LLM_BACKOFF_SECONDS * 2 ** attempt)  # full jitter
+    if time.monotonic() + pause >= deadline:
+        raise _timeout(f" (last error: {e})") from e  # no time left for another attempt
+    if attempt >= LLM_RETRIES:
+        raise RuntimeError(f"Gemini API error: {e}") from e
+    metrics.LLM_RETRIES.inc()
+    return pause
+
+
+# -------------------- public API --------------------
+
+def generate_sql(natural_language_query: str,
+                 schema_metadata: Dict[str, List[Dict]],
+                 dialect: str = "postgresql",
+                 feedback: str | None = None,
+                 gate=None) -> str:
+    """
+    SQL for the question, within LLM_DEADLINE_SECONDS (hedge and retries
+    included; LLMTimeout past it). `gate` is the limits.Bulkhead every
+    model request takes a slot of.
+    """
+    prompt = _build_prompt(natural_language_query, schema_metadata, dialect, feedback)
+
+    def post(raw: str) -> str:
+        return _postprocess(raw, natural_language_query, schema_metadata, dialect)
+
+    deadline = time.monotonic() + LLM_DEADLINE_SECONDS
+    for attempt in range(LLM_RETRIES + 1):
+        try:
+            return _hedged(prompt, post, deadline, gate)
+        except (LLMTimeout, limits.Overloaded):
+            raise
+        except Exception as e:
+            time.sleep(_backoff(attempt, e, deadline))
+    raise _timeout()
+
+async def generate_sql_async(natural_language_query: str,
+                             schema_metadata: Dict[str, List[Dict]],
+                             dialect: str = "postgresql",
+                             feedback: str | None = None,
+                             gate=None) -> str:
+    """Same as generate_sql, but awaits the model (gate: a limits.AsyncBulkhead)."""
+    prompt = _build_prompt(natural_language_query, schema_metadata, dialect, feedback)
+
+    def post(raw: str) -> str:
+        return _postprocess(raw, natural_language_query, schema_metadata, dialect)
+
+    deadline = time.monotonic() + LLM_DEADLINE_SECONDS
+    for attempt in range(LLM_RETRIES + 1):
+        try:
+            return await _hedged_async(prompt, post, deadline, gate)
+        except (LLMTimeout, limits.Overloaded):
+            raise
+        except Exception as e:
+            await asyncio.sleep(_backoff(attempt, e, deadline))
+    raise _timeout()
@@ -0,0 +1,239 @@
+# services/incremental.py
+"""
+Incremental refresh of time-bucketed aggregates (saved-query refreshes only;
+opt-in with INCREMENTAL_FULL_SECONDS > 0):
+- recognizes a SELECT whose rows are grouped on a date bucket
+  (DATE_TRUNC('unit', col), optionally inside TO_CHAR / a cast, or SQLite
+  strftime), e.g. the period/value shape from gemini's time-bucket rewrite
+- with an earlier result cached, only the newest INCREMENTAL_OPEN_BUCKETS
+  buckets are re-run (an extra `col >= <bucket start>` predicate), and the
+  fresh rows replace those buckets in the cached frame
+- closed buckets are assumed not to change; a full scan still runs every
+  INCREMENTAL_FULL_SECONDS to pick up late or corrected rows
+Statements with LIMIT/OFFSET, set operations, window functions, CTEs or an
+ORDER BY on anything but the bucket always run in full.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+import pandas as pd
+
+from services import cache, frames, metrics
+
+# seconds between full scans of a bucketed statement; 0 (default) disables incremental
+# mode, since closed buckets can be this stale (late or corrected rows)
+INCREMENTAL_FULL_SECONDS = float(os.getenv("INCREMENTAL_FULL_SECONDS", "0"))
+# newest buckets re-run on each refresh (the open one plus late-arriving rows in the previous one)
+INCREMENTAL_OPEN_BUCKETS = int(os.getenv("INCREMENTAL_OPEN_BUCKETS", "2"))
+
+_TOKEN = re.compile(r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|[A-Za-z_][\w$]*|\d+(?:\.\d+)?|::|\S""")
+_COL = r'(?:"(?:[^"]|"")+"|[A-Za-z_]\w*)(?:\s*\.\s*(?:"(?:[^"]|"")+"|[A-Za-z_]\w*))?'
+_TRUNC = re.compile(rf"(?is)\bdate_trunc\s*\(\s*'(\w+)'\s*,\s*({_COL})\s*\)")
+_STRFTIME = re.compile(rf"(?is)\bstrftime\s*\(\s*'([^']+)'\s*,\s*({_COL})\s*\)")
+_SQLITE_UNITS = {"%Y-%m-%d": "day", "%Y-%m-01": "month", "%Y-%m": "month", "%Y-01-01": "year", "%Y": "year"}
+_UNITS = {"day", "week", "month", "quarter", "year"}
+_AGGREGATES = re.compile(r"(?i)\b(sum|count|avg|min|max)\s*\(")
+# top-level words that end the clause before them
+_CLAUSES = {"from", "where", "group", "having", "order", "limit", "offset", "window", "fetch",
+            "union", "intersect", "except", "for"}
+
+
+@dataclass
+class Plan:
+    position: int       # 0-based output column holding the bucket
+    column: str         # date column text as written, e.g. "month" or t."month"
+    where: Optional[Tuple[int, int]]  # character span of the top-level WHERE body
+    group_at: int       # character offset of the top-level GROUP BY
+    order: Optional[bool]  # None: no ORDER BY; True/False: bucket ascending/descending
+
+
+def _scan(sql: str):
+    """(lower-cased token, start, end, paren depth) for every token."""
+    out, depth = [], 0
+    for m in _TOKEN.finditer(sql):
+        tok = m.group()
+        if tok == ")":
+            depth -= 1
+        out.append((tok.lower(), m.start(), m.end(), depth))
+        if tok == "(":
+            depth += 1
+    return out
+
+
+def _split(sql: str, toks, lo: int, hi: int) -> List[str]:
+    """Top-level comma-separated items of toks[lo:hi], as text."""
+    items, start = [], lo
+    for i in range(lo, hi + 1):
+        if i == hi or (toks[i][0] == "," and toks[i][3] == 0):
+            if start < i:
+                items.append(sql[toks[start][1]:toks[i - 1][2]].strip())
+            start = i + 1
+    return items
+
+
+def _bare(name: str) -> str:
+    return name.strip().strip('"').lower()
+
+
+def plan(sql: str) -> Optional[Plan]:
+    """How to narrow `sql` to its newest buckets; None if it isn't a bucketed aggregate."""
+    toks = _scan(sql or "")
+    words = [t[0] for t in toks]
+    if not toks or words[0] != "select" or "over" in words:
+        return None
+    top = {}
+    for i, (w, _, _, depth) in enumerate(toks):
+        if depth == 0 and w in _CLAUSES:
+            if w in top:
+                return None  # a clause twice at top level: not a plain SELECT
+            top[w] = i
+    if not {"from", "group"} <= top.keys() or top.keys() & {"limit", "offset", "fetch", "union", "intersect",
+                                                             "except", "window", "for"}:
+        return None
+
+    first = 2 if len(words) > 1 and words[1] == "distinct" else 1
+    select = _split(sql, toks, first, top["from"])
+    bucket = None
+    for pos, item in enumerate(select):
+        m = _TRUNC.search(item)
+        unit = m.group(1).lower() if m else None
+        if m is None:
+            m = _STRFTIME.search(item)
+            unit = _SQLITE_UNITS.get(m.group(1)) if m else None
+        if m is None or unit not in _UNITS or _AGGREGATES.search(item):
+            continue
+        alias = re.search(r'(?is)\bas\s+("(?:[^"]|"")+"|\w+)\s*$', item)
+        expr = item[:alias.start()].strip() if alias else item
+        # ways GROUP BY / ORDER BY may name the bucket: position, alias, expression
+        bucket = (pos, m.group(2), {str(pos + 1), _bare(alias.group(1)) if alias else None,
+                                    " ".join(expr.lower().split()), " ".join(m.group(0).lower().split())})
+        break
+    if bucket is None:
+        return None
+    pos, column, names = bucket
+
+    def clause_end(i: int) -> int:
+        later = [j for j in top.values() if j > i]
+        return min(later) if later else len(toks)
+
+    g = top["group"]
+    if g + 1 >= len(toks) or words[g + 1] != "by":
+        return None
+    keys = _split(sql, toks, g + 2, clause_end(g))
+    if not any(" ".join(k.lower().split()) in names or _bare(k) in names for k in keys):
+        return None
+
+    order = None
+    if "order" in top:
+        o = top["order"]
+        items = _split(sql, toks, o + 2, clause_end(o))
+        if len(items) != 1:
+            return None
+        key = re.sub(r"(?is)\s+(asc|desc)?\s*(nulls\s+(first|last))?\s*$", "", items[0])
+        if " ".join(key.lower().split()) not in names and _bare(key) not in names:
+            return None
+        order = not re.search(r"(?i)\bdesc\b", items[0][len(key):])
+
+    where = None
+    if "where" in top:
+        w = top["where"]
+        end = clause_end(w)
+        where = (toks[w][2], toks[end - 1][2])
+    return Plan(position=pos, column=column, where=where, group_at=toks[g][1], order=order)
+
+
+def _periods(df: pd.DataFrame, p: Plan) -> pd.Series:
+    # bucket values as timestamps: 'YYYY-MM-DD' / 'YYYY-MM' text, dates or timestamps;
+    # timestamptz buckets (offsets may differ across DST) are compared in UTC
+    s = df.iloc[:, p.position]
+    if isinstance(s.dtype, pd.DatetimeTZDtype):
+        return s.dt.tz_convert("UTC")
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        s = s.astype(object)
+    first = s.dropna().iloc[0] if s.notna().any() else None
+    if isinstance(first, datetime) and first.tzinfo is not None:
+        return pd.to_datetime(s, errors="coerce", utc=True)
+    return pd.to_datetime(s.astype(str).where(s.notna()), errors="coerce", format="mixed")
+
+
+def narrow(sql: str, p: Plan, base: pd.DataFrame) -> Optional[Tuple[str, pd.Timestamp]]:
+    """`sql` restricted to the newest buckets of `base`, and the cutoff; None when a full run is better."""
+    periods = _periods(base, p).dropna().drop_duplicates().sort_values()
+    if len(periods) <= INCREMENTAL_OPEN_BUCKETS:
+        return None
+    cutoff = periods.iloc[-INCREMENTAL_OPEN_BUCKETS]
+    if cutoff.tzinfo is not None:
+        literal = cutoff.isoformat(sep=" ")  # keeps the offset: the same instant in any session time zone
+    else:
+        literal = cutoff.strftime("%Y-%m-%d %H:%M:%S" if cutoff != cutoff.normalize() else "%Y-%m-%d")
+    pred = f"{p.column} >= '{literal}'"
+    if p.where:
+        a, b = p.where
+        return f"{sql[:a]} {pred} AND ({sql[a:b].strip()}){sql[b:]}", cutoff
+    return f"{sql[:p.group_at]}WHERE {pred} {sql[p.group_at:]}", cutoff
+
+
+def merge(p: Plan, base: pd.DataFrame, fresh: pd.DataFrame, cutoff: pd.Timestamp) -> pd.DataFrame:
+    """Closed buckets from `base` plus the re-run buckets from `fresh`."""
+    periods = _periods(base, p)
+    # NULL buckets can't be re-run by a >= predicate: keep them as they were
+    keep = base[(periods < cutoff) | periods.isna()]
+    fresh = fresh.set_axis(base.columns, axis=1)
+    df = frames.concat([keep, fresh])
+    if p.order is not None:
+        order = _periods(df, p).sort_values(ascending=p.order, kind="stable", na_position="first").index
+        df = df.loc[order].reset_index(drop=True)
+        df.attrs["memory_bytes"] = int(df.memory_usage(index=True, deep=True).sum())
+    return df
+
+
+# -------------------- fetch --------------------
+
+def _narrowed(sql: str, k: str):
+    """(plan, base frame, full-scan time, narrowed sql, cutoff); plan is None when not bucketed."""
+    p = plan(sql) if INCREMENTAL_FULL_SECONDS > 0 else None
+    if p is None:
+        return None, None, None, None, None
+    hit = cache.get("bucketed", k)
+    if hit is None:
+        return p, None, None, None, None
+    base, full_at = hit
+    if time.time() - full_at > INCREMENTAL_FULL_SECONDS:
+        return p, None, None, None, None
+    narrowed = narrow(sql, p, base)
+    if narrowed is None:
+        return p, None, None, None, None
+    return (p, base, full_at) + narrowed
+
+
+def _keep(k: str, df: pd.DataFrame, full_at: float, shareable: Callable[[pd.DataFrame], bool]) -> None:
+    if not df.attrs.get("truncated") and shareable(df):
+        ttl = INCREMENTAL_FULL_SECONDS - (time.time() - full_at)
+        cache.set("bucketed", k, (df, full_at), ttl)
+
+
+def fetch(sql: str, k: str, run: Callable[[str], pd.DataFrame],
+          shareable: Callable[[pd.DataFrame], bool]) -> pd.DataFrame:
+    """run(sql), re-running only the newest buckets when an earlier result of `sql` is cached."""
+    p, base, full_at, narrowed, cutoff = _narrowed(sql, k)
+    if p is None:
+        return run(sql)
+    if narrowed is not None:
+        fresh = run(narrowed)
+        if not fresh.attrs.get("truncated"):
+            metrics.BUCKETED_FETCHES.inc(mode="incremental")
+            df = merge(p, base, fresh, cutoff)
+            _keep(k, df, full_at, shareable)
+            return df
+    metrics.BUCKETED_FETCHES.inc(mode="full")
+    df = run(sql)
+    _keep(k, df, time.time(), shareable)
+    return df
+
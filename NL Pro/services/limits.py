@@ -0,0 +1,204 @@
+# services/limits.py
+"""
+Admission control (bulkheads) for the shared downstreams:
+- one bounded semaphore per resource (LLM, DB, exports)
+- bounded wait queue: a full queue is rejected at once (429), a caller
+  that waits longer than the queue timeout gives up (503)
+- queue depth / in-flight gauges and rejection counters on /metrics
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from services import metrics
+
+QUEUE_DEPTH = metrics.Gauge("nlpro_bulkhead_queue_depth", "Callers waiting for a bulkhead slot.")
+IN_FLIGHT = metrics.Gauge("nlpro_bulkhead_in_flight", "Calls holding a bulkhead slot.")
+REJECTED = metrics.Counter("nlpro_bulkhead_rejected_total", "Calls rejected by admission control.")
+
+
+class Overloaded(Exception):
+    """Raised when a bulkhead cannot admit a call; carries the HTTP status to send."""
+
+    def __init__(self, resource: str, status: int, retry_after: int):
+        reason = "queue full" if status == 429 else "queue timeout"
+        super().__init__(f"{resource} is overloaded ({reason}); retry in {retry_after}s.")
+        self.resource = resource
+        self.status = status
+        self.retry_after = retry_after
+
+
+class _BulkheadBase:
+    def __init__(self, name: str, limit: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._active = 0
+
+    def _enter_queue(self):
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                REJECTED.inc(resource=self.name, reason="queue_full")
+                raise Overloaded(self.name, 429, max(1, int(self.queue_timeout)))
+            self._waiting += 1
+            QUEUE_DEPTH.set(self._waiting, resource=self.name)
+
+    def _leave_queue(self, acquired: bool):
+        with self._lock:
+            self._waiting -= 1
+            QUEUE_DEPTH.set(self._waiting, resource=self.name)
+            if acquired:
+                self._active += 1
+                IN_FLIGHT.set(self._active, resource=self.name)
+
+    def _timed_out(self):
+        REJECTED.inc(resource=self.name, reason="queue_timeout")
+        raise Overloaded(self.name, 503, max(1, int(self.queue_timeout)))
+
+    def _done(self):
+        with self._lock:
+            self._active -= 1
+            IN_FLIGHT.set(self._active, resource=self.name)
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "in_flight": self._active, "waiting": self._waiting}
+
+
+class Bulkhead(_BulkheadBase):
+    """Thread bulkhead for the WSGI workers and batch pools."""
+
+    def __init__(self, name: str, limit: int, max_queue: int, queue_timeout: float):
+        super().__init__(name, limit, max_queue, queue_timeout)
+        self._sem = threading.BoundedSemaphore(limit)
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """
+        Take a slot (raises Overloaded like slot()); blocking=False takes one
+        only if free, without queueing, and returns False otherwise.
+        Pair with release(), which may run on another thread.
+        """
+        if not blocking:
+            if not self._sem.acquire(blocking=False):
+                return False
+            with self._lock:
+                self._active += 1
+                IN_FLIGHT.set(self._active, resource=self.name)
+            return True
+        self._enter_queue()
+        acquired = False
+        try:
+            acquired = self._sem.acquire(timeout=self.queue_timeout)
+        finally:
+            self._leave_queue(acquired)
+        if not acquired:
+            self._timed_out()
+        return True
+
+    def release(self):
+        self._sem.release()
+        self._done()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class AsyncBulkhead(_BulkheadBase):
+    """
+    Same policy for the asyncio path (asgi.py). With `shared` (a Bulkhead),
+    every slot also holds one of its slots, so threads and coroutines in a
+    process draw on one budget (e.g. the Flask routes mounted in asgi.py).
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int, queue_timeout: float,
+                 shared: Bulkhead | None = None):
+        super().__init__(name, limit, max_queue, queue_timeout)
+        self._sem = asyncio.Semaphore(limit)
+        self.shared = shared
+
+    async def _take_shared(self, deadline: float) -> bool:
+        # a thread semaphore can't be awaited: poll it, backing off to 50 ms
+        pause = 0.001
+        while not self.shared.acquire(blocking=False):
+            if time.monotonic() + pause > deadline:
+                return False
+            await asyncio.sleep(pause)
+            pause = min(pause * 2, 0.05)
+        return True
+
+    async def acquire(self, blocking: bool = True) -> bool:
+        """Async twin of Bulkhead.acquire(); release() may run from a done callback."""
+        if not blocking:
+            if self._sem.locked():
+                return False
+            await self._sem.acquire()  # free, so this doesn't wait
+            if self.shared is not None and not self.shared.acquire(blocking=False):
+                self._sem.release()
+                return False
+            with self._lock:
+                self._active += 1
+                IN_FLIGHT.set(self._active, resource=self.name)
+            return True
+        deadline = time.monotonic() + self.queue_timeout
+        self._enter_queue()
+        acquired = False
+        try:
+            await asyncio.wait_for(self._sem.acquire(), timeout=self.queue_timeout)
+            try:
+                acquired = self.shared is None or await self._take_shared(deadline)
+            finally:
+                if not acquired:  # timed out or cancelled while polling
+                    self._sem.release()
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._leave_queue(acquired)
+        if not acquired:
+            self._timed_out()
+        return True
+
+    def release(self):
+        if self.shared is not None:
+            self.shared.release()
+        self._sem.release()
+        self._done()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+def from_env(resource: str, limit: int, max_queue: int, queue_timeout: float,
+             cls=Bulkhead, prefix: str | None = None, **kwargs):
+    """Bulkhead configured by <PREFIX>_CONCURRENCY / _MAX_QUEUE / _QUEUE_TIMEOUT."""
+    prefix = prefix or resource.upper()
+    return cls(
+        resource,
+        int(os.getenv(f"{prefix}_CONCURRENCY", str(limit))),
+        int(os.getenv(f"{prefix}_MAX_QUEUE", str(max_queue))),
+        float(os.getenv(f"{prefix}_QUEUE_TIMEOUT", str(queue_timeout))),
+        **kwargs,
+    )
+
+
+# Per-worker limits: size DB so workers * DB_CONCURRENCY stays under the
+# server's connection budget, and LLM under the API rate limit.
+LLM = from_env("llm", 8, 32, 10)
+DB = from_env("db", 8, 64, 15)
+EXPORT = from_env("export", 2, 4, 30)
@@ -0,0 +1,138 @@
+# services/metrics.py
+"""
+Tiny in-process metrics registry rendered in Prometheus text format:
+- Counter / Gauge / Histogram with label support
+- thread-safe; one registry per worker process, so /metrics shows only the
+  worker that answered (nlpro_worker_info carries its pid): scrape workers
+  individually and aggregate in Prometheus
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from typing import Dict, List, Tuple
+
+_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_REGISTRY: List["_Metric"] = []
+
+
+def _label_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(key: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        super().__init__(name, help_text)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self._header() + [f"{self.name}{_fmt_labels(k)} {_fmt_num(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets=_LATENCY_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[tuple, list] = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(s)) for k, s in self._series.items()]
+        lines = self._header()
+        for key, s in items:
+            for b, n in zip(self.buckets, s):
+                le = 'le="%s"' % _fmt_num(b)
+                lines.append(f"{self.name}_bucket{_fmt_labels(key, le)} {n}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_fmt_labels(key, le)} {s[-1]}")
+            lines.append(f"{self.name}_sum{_fmt_labels(key)} {_fmt_num(s[-2])}")
+            lines.append(f"{self.name}_count{_fmt_labels(key)} {s[-1]}")
+        return lines
+
+
+def render() -> str:
+    with WORKER._lock:
+        WORKER._values = {_label_key({"pid": os.getpid()}): 1}  # never a pre-fork pid
+    lines: List[str] = []
+    for m in _REGISTRY:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+# -------------------- app metrics --------------------
+
+REQUEST_SECONDS = Histogram("nlpro_request_seconds", "End-to-end request latency.")
+STAGE_SECONDS = Histogram("nlpro_stage_seconds", "Latency of each request stage (llm, db, coerce, ...).")
+LLM_CALLS = Counter("nlpro_llm_calls_total", "Calls made to the SQL-generation model.")
+DB_ERRORS = Counter("nlpro_db_errors_total", "Statements that failed in the database.")
+ROWS_RETURNED = Counter("nlpro_rows_returned_total", "Result rows returned to clients.")
+CACHE_LOOKUPS = Counter("nlpro_cache_lookups_total", "Shared cache lookups by cache and outcome.")
+BYTES_SENT = Counter("nlpro_response_bytes_total", "Response body bytes sent (after compression).")
+SQL_VALIDATION = Counter("nlpro_sql_validation_total", "Generated SQL checked against the schema, by outcome.")
+RAW_BYTES = Counter("nlpro_response_raw_bytes_total", "Response body bytes before compression.")
+LLM_HEDGES = Counter("nlpro_llm_hedges_total", "Hedge requests to the model, by outcome (fired, won, skipped).")
+LLM_RETRIES = Counter("nlpro_llm_retries_total", "Model calls retried after a transient error.")
+BUCKETED_FETCHES = Counter("nlpro_bucketed_fetches_total", "Time-bucketed results fetched, full or incremental.")
+SLOW_LOG = Counter("nlpro_slow_log_total", "Slow-query log entries, by outcome (explained, cached_plan, no_plan, dropped).")
+WORKER = Gauge("nlpro_worker_info", "Always 1; the pid label names the worker process these metrics come from.")
@@ -0,0 +1,169 @@
+# services/params.py
+"""
+Literal extraction for generated SQL:
+- comparison / IN / BETWEEN / LIMIT / OFFSET literals become :pN binds, so
+  "same query, different value" runs one statement text (plan reuse on
+  drivers that prepare, one entry in the driver's statement cache); equal
+  literals share one bind, so an expression repeated in SELECT and GROUP BY
+  stays the same expression for servers that bind parameters themselves
+- formatting arguments (DATE_TRUNC('month', ...), TO_CHAR, COALESCE(x, 0)),
+  positional GROUP BY / ORDER BY numbers and casts stay literal
+- question "shape": the question with its literals (numbers, dates, quoted
+  strings) blanked, plus the mapping from those literals to binds, so a
+  cached template can be reused for a question that only differs in value
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+_TOKEN = re.compile(
+    r"""
+    (?P<ident>"(?:[^"]|"")*")
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<number>(?<![\w.:$])\d+(?:\.\d+)?(?![\w.]))
+  | (?P<word>[A-Za-z_][\w$]*)
+  | (?P<op><>|!=|<=|>=|::|[=<>(),])
+  | (?P<other>\s+|.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+# tokens after which a literal is a value (not a format string or position)
+_VALUE_AFTER = {"=", "<>", "!=", "<", ">", "<=", ">=", "like", "ilike", "between", "limit", "offset"}
+# wrappers allowed between the operator and the literal: LOWER('x'), TRIM('x')
+_WRAPPERS = {"lower", "upper", "trim", "("}
+
+
+def _value(kind: str, text: str) -> Any:
+    if kind == "string":
+        return text[1:-1].replace("''", "'")
+    return float(text) if "." in text else int(text)
+
+
+def parameterize(sql: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    Split SQL into a template with :pN placeholders and their values.
+    Returns the SQL unchanged (and no binds) when nothing qualifies.
+    """
+    out: List[str] = []
+    binds: Dict[str, Any] = {}
+    names: Dict[Tuple[str, str], str] = {}  # (kind, literal text) -> bind name
+    last = ""              # last significant token, lower-cased
+    anchor = ""            # operator the next literal would bind to
+    depth = in_depth = 0   # paren depth, and depth of an open IN ( ... ) list
+    between = False        # inside BETWEEN x AND y
+    tokens = [(m.lastgroup, m.group()) for m in _TOKEN.finditer(sql or "")]
+    for i, (kind, text) in enumerate(tokens):
+        if kind == "other" and text.isspace():
+            out.append(text)
+            continue
+        low = text.lower()
+        out.append(text)
+        if kind in ("string", "number"):
+            nxt = next((t for k, t in tokens[i + 1:] if not (k == "other" and t.isspace())), "")
+            in_list = in_depth == depth and in_depth and last in ("(", ",")
+            if (anchor in _VALUE_AFTER or in_list) and nxt != "::":
+                name = names.get((kind, text))
+                if name is None:
+                    name = names[(kind, text)] = f"p{len(binds)}"
+                    binds[name] = _value(kind, text)
+                out[-1] = f":{name}"
+        elif low == "and" and between:
+            between, anchor = False, "between"
+        else:
+            if low == "(":
+                depth += 1
+                in_depth = depth if last == "in" else in_depth
+            elif low == ")":
+                in_depth = 0 if depth == in_depth else in_depth
+                depth -= 1
+            between = between or low == "between"
+            if low in _VALUE_AFTER:
+                anchor = low
+            elif not (low in _WRAPPERS and anchor in _VALUE_AFTER):
+                anchor = ""
+        last = low
+    if not binds:
+        return sql, {}
+    return "".join(out), binds
+
+
+def render(template: str, binds: Dict[str, Any]) -> str:
+    """Inverse of parameterize(): inline the values as SQL literals."""
+    def lit(m):
+        v = binds[m.group(1)]
+        if isinstance(v, str):
+            return "'" + v.replace("'", "''") + "'"
+        return repr(v)
+    return re.sub(r"(?<![:\w]):(p\d+)\b", lit, template)
+
+
+# -------------------- question shapes --------------------
+
+_Q_LITERAL = re.compile(r"""'([^']*)'|"([^"]*)"|\b(\d{4}-\d{2}-\d{2})\b|(?<![\w.])(\d+(?:\.\d+)?)(?![\w.])""")
+
+
+def question_shape(question: str) -> Tuple[str, List[str]]:
+    """Normalized question with literals replaced by '?', and the literals in order."""
+    literals: List[str] = []
+
+    def blank(m):
+        literals.append(next(g for g in m.groups() if g is not None))
+        return "?"
+    shape = _Q_LITERAL.sub(blank, " ".join((question or "").lower().split()))
+    return shape, literals
+
+
+def _affixes(value: str, literal: str) -> Optional[Tuple[str, str]]:
+    # ILIKE '%acme%' still maps to the literal "acme"
+    low, lit = value.lower(), literal.lower()
+    at = low.find(lit)
+    if at < 0 or low[:at].strip("%") or low[at + len(lit):].strip("%"):
+        return None
+    return value[:at], value[at + len(lit):]
+
+
+def slots(binds: Dict[str, Any], literals: List[str]) -> Optional[Dict[str, list]]:
+    """
+    Map binds to the question literals they came from. Returns None unless
+    every literal feeds exactly one bind; otherwise reusing the template
+    could keep a stale value or overwrite an unrelated one.
+    """
+    matches = {}
+    for name, v in binds.items():
+        hits = []
+        for i, lit in enumerate(literals):
+            if isinstance(v, str):
+                fix = _affixes(v, lit)
+                if fix is not None:
+                    hits.append([i, "str", fix[0], fix[1]])
+            elif re.fullmatch(r"\d+(?:\.\d+)?", lit) and float(lit) == v:
+                hits.append([i, type(v).__name__, "", ""])
+        if len(hits) > 1:
+            return None
+        if hits:
+            matches[name] = hits[0]
+    used = [m[0] for m in matches.values()]
+    # every literal must drive exactly one bind; anything else is ambiguous
+    if sorted(used) != list(range(len(literals))):
+        return None
+    return matches
+
+
+def bind_shape(binds: Dict[str, Any], mapping: Dict[str, list], literals: List[str]) -> Optional[Dict[str, Any]]:
+    """New bind values for a question of the same shape (None if a literal doesn't fit)."""
+    out = dict(binds)
+    try:
+        for name, (i, kind, pre, post) in mapping.items():
+            lit = literals[i]
+            if kind == "str":
+                out[name] = f"{pre}{lit}{post}"
+            elif kind == "int":
+                out[name] = int(lit)
+            else:
+                out[name] = float(lit)
+    except (IndexError, ValueError):
+        return None
+    return out
@@ -0,0 +1,193 @@
+# services/profiling.py
+"""
+Diagnostics for slow requests:
+- structured slow-query log (JSON lines) with stage timings and the plan;
+  entries go through a bounded queue to one writer thread per process, a
+  statement is EXPLAINed once (plans are remembered), and entries are
+  dropped when the queue is full, so a slow database doesn't get an extra
+  query per slow request; past SLOW_LOG_MAX_BYTES the log is rotated to
+  slow_queries.jsonl.1 (one old file kept)
+- opt-in sampling profiler for a single request thread, stored as
+  collapsed stacks (flamegraph.pl / speedscope compatible); only the
+  newest PROFILE_MAX_FILES are kept
+"""
+
+from __future__ import annotations
+
+import hmac
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from services import metrics
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "2000"))
+SLOW_LOG_PATH = os.path.join("storage", "slow_queries.jsonl")
+PROFILE_DIR = os.path.join("storage", "profiles")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+SLOW_LOG_QUEUE = int(os.getenv("SLOW_LOG_QUEUE", "100"))    # entries waiting for the writer
+SLOW_PLAN_CACHE = int(os.getenv("SLOW_PLAN_CACHE", "500"))  # statements whose plan is remembered
+SLOW_LOG_MAX_BYTES = int(os.getenv("SLOW_LOG_MAX_BYTES", str(16 * 2**20)))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+
+_log_lock = threading.Lock()
+_queue: "queue.Queue" = queue.Queue(maxsize=SLOW_LOG_QUEUE)
+_writer: Optional[threading.Thread] = None
+_writer_pid: Optional[int] = None
+_writer_lock = threading.Lock()
+_plans: "OrderedDict[str, List[str] | None]" = OrderedDict()
+
+# -------------------- slow-query log --------------------
+
+def log_slow(entry: Dict, explain=None) -> None:
+    """
+    Append one slow-query record (on the writer thread, see submit_slow).
+    `explain` (sql -> plan lines) runs once per statement; later entries
+    for the same SQL reuse the remembered plan.
+    """
+    sql = entry.get("sql")
+    if explain and sql:
+        if sql in _plans:
+            _plans.move_to_end(sql)
+            entry["plan"] = _plans[sql]
+            metrics.SLOW_LOG.inc(outcome="cached_plan")
+        else:
+            try:
+                entry["plan"] = explain(sql)
+                _plans[sql] = entry["plan"]
+                if len(_plans) > SLOW_PLAN_CACHE:
+                    _plans.popitem(last=False)
+                metrics.SLOW_LOG.inc(outcome="explained")
+            except Exception as e:
+                entry["plan_error"] = str(e)
+                metrics.SLOW_LOG.inc(outcome="no_plan")
+    try:
+        os.makedirs(os.path.dirname(SLOW_LOG_PATH), exist_ok=True)
+        with _log_lock:
+            if os.path.exists(SLOW_LOG_PATH) and os.path.getsize(SLOW_LOG_PATH) >= SLOW_LOG_MAX_BYTES:
+                os.replace(SLOW_LOG_PATH, SLOW_LOG_PATH + ".1")
+            with open(SLOW_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, default=str) + "\n")
+    except Exception:
+        pass
+
+def _write_loop():
+    while True:
+        entry, explain = _queue.get()
+        log_slow(entry, explain)
+
+def submit_slow(entry: Dict, explain: Optional[Callable[[str], Optional[List[str]]]] = None) -> bool:
+    """
+    Queue a slow-query record for the writer thread (started once per
+    process); False if the queue is full and the entry was dropped.
+    """
+    global _queue, _writer, _writer_pid
+    with _writer_lock:
+        if _writer_pid != os.getpid():  # first use, or first use after fork
+            _queue = queue.Queue(maxsize=SLOW_LOG_QUEUE)
+            _writer = threading.Thread(target=_write_loop, name="slow-log", daemon=True)
+            _writer.start()
+            _writer_pid = os.getpid()
+    try:
+        _queue.put_nowait((entry, explain))
+        return True
+    except queue.Full:
+        metrics.SLOW_LOG.inc(outcome="dropped")
+        return False
+
+def _tail(path: str, limit: int, block: int = 64 * 1024) -> List[bytes]:
+    """Last `limit` lines of a file, read backwards in blocks."""
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        data = b""
+        while end > 0 and data.count(b"\n") <= limit:
+            start = max(0, end - block)
+            f.seek(start)
+            data = f.read(end - start) + data
+            end = start
+    return data.splitlines()[-limit:] if limit > 0 else []
+
+def read_slow(limit: int = 100) -> List[Dict]:
+    try:
+        lines = _tail(SLOW_LOG_PATH, limit)
+        return [json.loads(ln) for ln in reversed(lines) if ln.strip()]
+    except Exception:
+        return []
+
+# -------------------- sampling profiler --------------------
+
+def authorized(token: str) -> bool:
+    # constant-time: the comparison mustn't reveal how much of the token matched
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8"))
+
+class SamplingProfiler:
+    """
+    Samples one thread's Python stack every PROFILE_INTERVAL_MS from a
+    helper thread. Overhead is a dict lookup per sample, so it is safe to
+    switch on for a single production request.
+    """
+
+    def __init__(self, thread_id: int, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000.0
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self) -> "SamplingProfiler":
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> str:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        return "\n".join(f"{stack} {n}" for stack, n in self.samples.most_common())
+
+def new_profile_id() -> str:
+    return time.strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:8]
+
+def save_profile(collapsed: str, meta: Dict, profile_id: Optional[str] = None) -> str:
+    """Store a collapsed-stack profile (under `profile_id` if given); returns its id."""
+    profile_id = profile_id or new_profile_id()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, profile_id + ".txt"), "w", encoding="utf-8") as f:
+        f.write("# " + json.dumps(meta, default=str) + "\n")
+        f.write(collapsed + "\n")
+    for old in list_profiles()[PROFILE_MAX_FILES:]:  # ids sort by time, newest first
+        try:
+            os.remove(os.path.join(PROFILE_DIR, old + ".txt"))
+        except OSError:
+            pass
+    return profile_id
+
+def profile_path(profile_id: str) -> Optional[str]:
+    if not profile_id or not all(ch.isalnum() or ch in "-T" for ch in profile_id):
+        return None
+    path = os.path.join(PROFILE_DIR, profile_id + ".txt")
+    return path if os.path.exists(path) else None
+
+def list_profiles() -> List[str]:
+    try:
+        return sorted((f[:-4] for f in os.listdir(PROFILE_DIR) if f.endswith(".txt")), reverse=True)
+    except FileNotFoundError:
+        return []
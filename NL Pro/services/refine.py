@@ -0,0 +1,181 @@
+# services/refine.py
+"""
+In-process refinement of a cached result DataFrame:
+- filter / sort / top / group operations applied with vectorized pandas
+- a small parser that turns simple follow-up questions ("sort by x desc",
+  "top 10 by spends", "only where brand = acme", "sum of spends by brand")
+  into those operations so they skip Gemini and the database entirely
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Dict, List, Optional
+
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+_AGGS = {"sum": "sum", "total": "sum", "avg": "mean", "average": "mean", "mean": "mean",
+         "count": "count", "min": "min", "minimum": "min", "max": "max", "maximum": "max"}
+_CMPS = {"=": "==", "==": "==", "is": "==", "equals": "==", "!=": "!=", "<>": "!=", "is not": "!=",
+         ">": ">", ">=": ">=", "<": "<", "<=": "<=", "contains": "contains", "like": "contains"}
+
+# -------------------- operations --------------------
+
+def _col(df: pd.DataFrame, name) -> str:
+    if name not in df.columns:
+        raise ValueError(f"Unknown column: {name}")
+    return name
+
+def _coerce_value(series: pd.Series, value):
+    if is_numeric_dtype(series) and isinstance(value, str):
+        try:
+            return float(value) if "." in value else int(value)
+        except ValueError:
+            return value
+    return value
+
+def _filter(df: pd.DataFrame, op: Dict) -> pd.DataFrame:
+    col = _col(df, op.get("column"))
+    cmp = _CMPS.get(str(op.get("cmp", "==")).lower(), op.get("cmp"))
+    s = df[col]
+    value = op.get("value")
+    if cmp == "in":
+        if not isinstance(value, list):
+            raise ValueError("'in' needs a list value")
+        mask = s.isin([_coerce_value(s, v) for v in (value or [])])
+    elif cmp == "contains":
+        mask = s.astype("string").str.contains(str(value), case=False, regex=False, na=False)
+    elif cmp in ("==", "!="):
+        v = _coerce_value(s, value)
+        if isinstance(v, str) and not is_numeric_dtype(s):
+            # text equality is case-insensitive, like the generated SQL
+            mask = s.astype("string").str.lower() == v.lower()
+            mask = mask.fillna(False)
+        else:
+            mask = s == v
+        if cmp == "!=":
+            mask = ~mask
+    elif cmp in (">", ">=", "<", "<="):
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            s = s.astype(s.cat.categories.dtype)  # compacted text: compare values, not category order
+        v = _coerce_value(s, value)
+        mask = {">": s > v, ">=": s >= v, "<": s < v, "<=": s <= v}[cmp]
+    else:
+        raise ValueError(f"Unsupported comparison: {cmp}")
+    return df[mask.to_numpy(dtype=bool)]
+
+def _sort(df: pd.DataFrame, op: Dict) -> pd.DataFrame:
+    by = op.get("by")
+    by = [by] if isinstance(by, str) else list(by or [])
+    for c in by:
+        _col(df, c)
+    return df.sort_values(by, ascending=not op.get("desc", False), kind="stable", na_position="last")
+
+def _top(df: pd.DataFrame, op: Dict) -> pd.DataFrame:
+    n = int(op.get("n", 10))
+    if n < 0:
+        raise ValueError("n must be 0 or more")
+    if op.get("by"):
+        df = _sort(df, {"by": op["by"], "desc": op.get("desc", True)})
+    return df.head(n)
+
+def _group(df: pd.DataFrame, op: Dict) -> pd.DataFrame:
+    by = op.get("by")
+    by = [by] if isinstance(by, str) else list(by or [])
+    for c in by:
+        _col(df, c)
+    agg = op.get("agg") or {}
+    if not isinstance(agg, dict):
+        raise ValueError("agg must map columns to aggregates")
+    if not agg:
+        return df.groupby(by, sort=True, dropna=False, observed=True).size().reset_index(name="count")
+    named = {}
+    for c, fn in agg.items():
+        fn = _AGGS.get(str(fn).lower())
+        if fn is None:
+            raise ValueError(f"Unsupported aggregate for {c}")
+        named[f"{fn}_{c}"] = (_col(df, c), fn)
+    return df.groupby(by, sort=True, dropna=False, observed=True).agg(**named).reset_index()
+
+_OPS = {"filter": _filter, "sort": _sort, "top": _top, "group": _group}
+
+def apply_ops(df: pd.DataFrame, ops: List[Dict]) -> pd.DataFrame:
+    """Apply refine operations in order; raises ValueError on bad input."""
+    ops = ops or []
+    if not isinstance(ops, list) or not all(isinstance(op, dict) for op in ops):
+        raise ValueError("ops must be a list of objects")
+    for op in ops:
+        fn = _OPS.get(op.get("op"))
+        if fn is None:
+            raise ValueError(f"Unsupported operation: {op.get('op')}")
+        df = fn(df, op)
+    return df.reset_index(drop=True)
+
+# -------------------- follow-up question parser --------------------
+
+def _norm(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")
+
+def _resolve(name: str, columns: List[str]) -> Optional[str]:
+    wanted = _norm(name)
+    for c in columns:
+        if _norm(c) == wanted:
+            return c
+    # allow "spends" to match "total_spends" when unambiguous
+    hits = [c for c in columns if _norm(c).endswith("_" + wanted) or _norm(c).startswith(wanted + "_")]
+    return hits[0] if len(hits) == 1 else None
+
+def _parse_clause(clause: str, columns: List[str]) -> Optional[Dict]:
+    c = clause.strip().rstrip(".?!").strip()
+
+    m = re.fullmatch(r"(?i)(?:sort|order)(?:\s+it|\s+them)?\s+by\s+(.+?)(?:\s+(asc|ascending|desc|descending))?", c)
+    if m:
+        col = _resolve(m.group(1), columns)
+        return col and {"op": "sort", "by": col, "desc": (m.group(2) or "").lower().startswith("desc")}
+
+    m = re.fullmatch(r"(?i)(?:show\s+)?(?:only\s+)?(top|bottom|first)\s+(\d+)(?:\s+rows)?(?:\s+by\s+(.+))?", c)
+    if m:
+        op = {"op": "top", "n": int(m.group(2))}
+        if m.group(3):
+            col = _resolve(m.group(3), columns)
+            if not col:
+                return None
+            op.update(by=col, desc=m.group(1).lower() != "bottom")
+        return op
+
+    m = re.fullmatch(r"(?i)(sum|total|avg|average|mean|count|min|minimum|max|maximum)\s+(?:of\s+)?(.+?)\s+(?:by|per)\s+(.+)", c)
+    if m:
+        val, by = _resolve(m.group(2), columns), _resolve(m.group(3), columns)
+        return val and by and {"op": "group", "by": [by], "agg": {val: _AGGS[m.group(1).lower()]}}
+
+    m = re.fullmatch(r"(?i)group\s+by\s+(.+)", c)
+    if m:
+        by = _resolve(m.group(1), columns)
+        return by and {"op": "group", "by": [by]}
+
+    m = re.fullmatch(
+        r"(?i)(?:(?:only|just|filter|keep|show)\s+)*(?:where|with|rows\s+where)?\s*(.+?)\s+"
+        r"(is not|!=|<>|>=|<=|==|=|>|<|is|equals|contains|like)\s+['\"]?(.+?)['\"]?", c)
+    if m:
+        col = _resolve(m.group(1), columns)
+        return col and {"op": "filter", "column": col, "cmp": m.group(2).lower(), "value": m.group(3)}
+
+    return None
+
+def parse_followup(question: str, columns: List[str]) -> Optional[List[Dict]]:
+    """
+    Turn a simple follow-up question into refine ops against `columns`.
+    Returns None unless every clause is understood, so anything ambiguous
+    still goes through SQL generation.
+    """
+    clauses = [p for p in re.split(r"(?i)\s*(?:,|;|\band then\b|\bthen\b)\s*", question or "") if p.strip()]
+    if not clauses:
+        return None
+    ops = []
+    for clause in clauses:
+        op = _parse_clause(clause, columns)
+        if not op:
+            return None
+        ops.append(op)
+    return ops
@@ -0,0 +1,301 @@
+# services/saved.py
+"""
+Saved queries with scheduled refresh:
+- saved queries (name, question, pinned SQL, tables, schedule) live in
+  storage/saved_queries.json, shared by every worker; changes hold an
+  exclusive lock on a sibling .lock file (fcntl.flock where available)
+- schedules are 5-field cron expressions (minute hour day month weekday,
+  server local time) or @hourly / @daily / @weekly / @monthly
+- a background thread in each worker (started by app.start_background(),
+  never in the gunicorn master) looks for due queries every
+  SAVED_TICK_SECONDS; a lease in the shared cache makes exactly one worker
+  run each scheduled slot
+- refresh outcomes (refreshed_at, rows, error) are kept in the shared
+  cache, so any worker can report freshness
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: one process (the dev server), the thread lock is enough
+    fcntl = None
+
+from services import cache
+
+SAVED_PATH = os.getenv("SAVED_PATH", os.path.join("storage", "saved_queries.json"))
+SAVED_TICK_SECONDS = float(os.getenv("SAVED_TICK_SECONDS", "30"))  # 0 disables the scheduler
+SAVED_MAX = int(os.getenv("SAVED_MAX", "200"))
+# results stay cached this long past the next scheduled run (covers a slow or missed refresh)
+SAVED_GRACE_SECONDS = float(os.getenv("SAVED_GRACE_SECONDS", "900"))
+
+_lock = threading.Lock()
+_scheduler: Optional[threading.Thread] = None
+_refresh: Optional[Callable[[Dict], int]] = None
+
+
+# -------------------- cron --------------------
+
+_ALIASES = {"@hourly": "0 * * * *", "@daily": "0 0 * * *", "@midnight": "0 0 * * *",
+            "@weekly": "0 0 * * 0", "@monthly": "0 0 1 * *"}
+_FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+
+def _field(text: str, lo: int, hi: int) -> Set[int]:
+    out: Set[int] = set()
+    for part in text.split(","):
+        rng, _, step = part.partition("/")
+        if rng == "*":
+            a, b = lo, hi
+        elif "-" in rng:
+            a, b = (int(x) for x in rng.split("-", 1))
+        else:
+            a = b = int(rng)
+        n = int(step) if step else 1
+        if not (lo <= a <= b <= hi) or n < 1:
+            raise ValueError(f"{part!r} is out of range {lo}-{hi}")
+        out.update(range(a, b + 1, n))
+    return out
+
+
+class Cron:
+    """Parsed cron expression; next_after() gives the next matching minute."""
+
+    def __init__(self, expr: str):
+        text = _ALIASES.get(expr.strip().lower(), expr)
+        parts = text.split()
+        if len(parts) != 5:
+            raise ValueError("Schedule must have 5 fields (minute hour day month weekday) or be @hourly/@daily/...")
+        try:
+            self.minutes, self.hours, self.days, self.months, dows = (
+                _field(p, lo, hi) for p, (lo, hi) in zip(parts, _FIELDS)
+            )
+        except ValueError as e:
+            raise ValueError(f"Bad schedule {expr!r}: {e}") from None
+        self.dows = {d % 7 for d in dows}  # 0 and 7 are both Sunday
+        # cron semantics: if both day fields are restricted, either may match
+        self.any_day, self.any_dow = parts[2] == "*", parts[4] == "*"
+
+    def _day_ok(self, t: datetime) -> bool:
+        dom = t.day in self.days
+        dow = (t.weekday() + 1) % 7 in self.dows
+        if self.any_day or self.any_dow:
+            return dom and dow
+        return dom or dow
+
+    def next_after(self, ts: float) -> float:
+        t = datetime.fromtimestamp(ts).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        end = t + timedelta(days=366 * 5)
+        while t < end:
+            if t.month not in self.months:
+                t = (t.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0)
+            elif not self._day_ok(t):
+                t = (t + timedelta(days=1)).replace(hour=0, minute=0)
+            elif t.hour not in self.hours:
+                t = (t + timedelta(hours=1)).replace(minute=0)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t.timestamp()
+        raise ValueError("Schedule never fires.")
+
+
+# -------------------- storage --------------------
+
+def _read() -> List[Dict]:
+    try:
+        with open(SAVED_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def _write(items: List[Dict]) -> None:
+    os.makedirs(os.path.dirname(SAVED_PATH) or ".", exist_ok=True)
+    tmp = f"{SAVED_PATH}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(items, f, indent=2)
+    os.replace(tmp, SAVED_PATH)  # readers in other workers never see a partial file
+
+
+@contextmanager
+def _locked() -> Iterator[None]:
+    """Serialise read-modify-write of the store across threads and worker processes."""
+    with _lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(SAVED_PATH) or ".", exist_ok=True)
+        with open(f"{SAVED_PATH}.lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def list_saved() -> List[Dict]:
+    return _read()
+
+
+def get(saved_id: str) -> Optional[Dict]:
+    return next((s for s in _read() if s["id"] == saved_id), None)
+
+
+def add(name: str, question: str, sql: str, tables: List[str], schedule: str) -> Dict:
+    """Store a saved query; raises ValueError on a bad schedule, bad tables or a full store."""
+    if schedule:
+        cron = Cron(schedule)
+        try:
+            cron.next_after(time.time())
+        except ValueError:
+            raise ValueError(f"Bad schedule {schedule!r}: it never fires (e.g. Feb 31).") from None
+    if not isinstance(tables, list) or not all(isinstance(t, str) for t in tables):
+        raise ValueError("tables must be a list of table names.")
+    item = {
+        "id": uuid.uuid4().hex[:12],
+        "name": name or question[:80] or "Saved query",
+        "question": question,
+        "sql": sql,
+        "tables": tables,
+        "schedule": schedule,
+        "created": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+    }
+    with _locked():
+        items = _read()
+        if len(items) >= SAVED_MAX:
+            raise ValueError(f"At most {SAVED_MAX} saved queries.")
+        items.append(item)
+        _write(items)
+    return item
+
+
+def remove(saved_id: str) -> bool:
+    with _locked():
+        items = _read()
+        keep = [s for s in items if s["id"] != saved_id]
+        if len(keep) == len(items):
+            return False
+        _write(keep)
+    cache.delete("saved", saved_id)
+    return True
+
+
+# -------------------- freshness --------------------
+
+def status(saved_id: str) -> Dict:
+    """Last refresh outcome: {refreshed_at (epoch), rows, error}; empty if never run."""
+    return cache.get("saved", saved_id) or {}
+
+
+def record(saved_id: str, rows: Optional[int] = None, error: Optional[str] = None) -> Dict:
+    if error is None:
+        state = {"refreshed_at": time.time(), "rows": rows, "error": None}
+    else:
+        # keep the last good refresh time; retried once the slot's lease expires
+        state = dict(status(saved_id), error=error, failed_at=time.time())
+    cache.set("saved", saved_id, state, 366 * 86400)
+    return state
+
+
+def next_run(item: Dict, after: Optional[float] = None) -> Optional[float]:
+    """Next scheduled run; None when unscheduled or the stored schedule is unusable."""
+    if not item.get("schedule"):
+        return None
+    try:
+        return Cron(item["schedule"]).next_after(after if after is not None else time.time())
+    except ValueError:  # stored before validation was this strict, or edited by hand
+        return None
+
+
+def result_ttl(item: Dict) -> float:
+    """How long a refreshed result should stay cached: until the next run, plus grace."""
+    nxt = next_run(item)
+    return (nxt - time.time() if nxt else 0) + SAVED_GRACE_SECONDS
+
+
+def describe(item: Dict) -> Dict:
+    """Saved query plus freshness, JSON-ready."""
+    state = status(item["id"])
+    out = dict(item)
+    ts = state.get("refreshed_at")
+    out["refreshed_at"] = datetime.utcfromtimestamp(ts).isoformat(timespec="seconds") + "Z" if ts else None
+    out["age_s"] = round(time.time() - ts, 1) if ts else None
+    out["last_error"] = state.get("error")
+    nxt = next_run(item)
+    out["next_run"] = datetime.utcfromtimestamp(nxt).isoformat(timespec="seconds") + "Z" if nxt else None
+    return out
+
+
+# -------------------- scheduler --------------------
+
+def due(now: Optional[float] = None) -> List[Tuple[Dict, float]]:
+    """(saved query, slot) pairs whose scheduled slot has passed since their last refresh."""
+    now = now or time.time()
+    out = []
+    for item in _read():
+        if not item.get("schedule"):
+            continue
+        try:
+            cron = Cron(item["schedule"])
+            last = status(item["id"]).get("refreshed_at")
+            if last is None:
+                out.append((item, 0.0))  # never refreshed: warm it now
+                continue
+            slot = cron.next_after(last)
+            if slot <= now:
+                # several missed slots (e.g. server was down) collapse into one run
+                while True:
+                    nxt = cron.next_after(slot)
+                    if nxt > now:
+                        break
+                    slot = nxt
+                out.append((item, slot))
+        except ValueError:
+            continue  # unusable schedule: describe() shows no next_run
+    return out
+
+
+def run_due(refresh: Callable[[Dict], int]) -> int:
+    """Refresh every due saved query this worker wins the lease for; returns how many ran."""
+    ran = 0
+    for item, slot in due():
+        lease = f"{item['id']}:{int(slot)}"
+        if not cache.claim("saved_lease", lease, max(SAVED_TICK_SECONDS * 10, 600)):
+            continue  # another worker has this slot
+        try:
+            rows = refresh(item)
+            record(item["id"], rows=rows)
+        except Exception as e:
+            record(item["id"], error=str(e)[:500])
+        ran += 1
+    return ran
+
+
+def _loop():
+    while True:
+        time.sleep(SAVED_TICK_SECONDS)
+        try:
+            run_due(_refresh)
+        except Exception:
+            pass  # a broken store must not kill the thread
+
+
+def start_scheduler(refresh: Callable[[Dict], int]) -> bool:
+    """Start the background refresher (once per process). `refresh(item)` returns the row count."""
+    global _scheduler, _refresh
+    _refresh = refresh
+    if SAVED_TICK_SECONDS <= 0 or (_scheduler is not None and _scheduler.is_alive()):
+        return False
+    _scheduler = threading.Thread(target=_loop, name="saved-refresh", daemon=True)
+    _scheduler.start()
+    return True
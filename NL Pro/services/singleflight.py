@@ -0,0 +1,86 @@
+# services/singleflight.py
+"""
+Single-flight request coalescing:
+- concurrent calls with the same key share one in-flight computation
+- the first caller (leader) runs it; followers wait and get its result
+  (or its exception); on the asyncio path the work is its own task, so a
+  cancelled leader doesn't take its followers down with it
+- nothing is remembered once the call finishes; caching stays in cache.py
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict
+
+from services import metrics
+
+COALESCED = metrics.Counter("nlpro_coalesced_total", "Calls that joined an identical in-flight call.")
+
+
+class _Call:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: BaseException | None = None
+
+
+class Group:
+    """Thread version (WSGI workers, batch pools)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            COALESCED.inc(kind=self.name)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+        try:
+            call.value = fn()
+            return call.value
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+
+class AsyncGroup:
+    """asyncio version (asgi.py); one event loop per worker."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, asyncio.Task] = {}
+
+    def _finished(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved when every caller has gone away
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is not None:
+            COALESCED.inc(kind=self.name)
+        else:
+            # the work runs detached from whoever started it: any caller may be
+            # cancelled (client gone, hedge lost) while the others still wait
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda t: self._finished(key, t))
+        # shield: a caller's cancellation must not cancel the shared work
+        return await asyncio.shield(task)
@@ -0,0 +1,178 @@
+# services/validate.py
+"""
+Local, schema-aware check of generated SQL (no database round trip):
+- every FROM / JOIN table must exist (CTEs and derived tables are allowed)
+- qualified references (t.col, "t"."col") must name a column of that table
+- double-quoted identifiers must be a table, a column of a referenced
+  table, or an alias defined in the statement (with AS, or right after a
+  select-list expression: SUM(x) "total")
+Unquoted bare names (functions, keywords, casts) are left to the database,
+so the check errs on the side of letting a statement through.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Dict, List, Optional, Set
+
+_TOKEN = re.compile(r"""'(?:[^']|'')*'|"(?:[^"]|"")+"|[A-Za-z_][\w$]*|\d+(?:\.\d+)?|::|\S""")
+
+# FROM inside these calls is not a table reference: EXTRACT(YEAR FROM x)
+_FROM_FUNCS = {"extract", "substring", "trim", "overlay", "position"}
+# words that end a FROM item instead of aliasing it
+_CLAUSE = {
+    "where", "join", "inner", "left", "right", "full", "outer", "cross", "natural", "on", "using",
+    "group", "order", "limit", "offset", "having", "union", "intersect", "except", "window",
+    "fetch", "for", "lateral", "as",
+}
+# words after which a quoted name starts an expression rather than aliasing one
+_NOT_EXPR_END = {
+    "select", "distinct", "all", "by", "and", "or", "not", "on", "where", "when", "then", "else",
+    "case", "in", "is", "like", "ilike", "between", "having", "as", "from", "join", "using",
+    "with", "over", "partition", "filter", "returning", "exists", "any", "some", "set", "values",
+}
+
+
+class InvalidSQL(ValueError):
+    """Generated SQL that references tables/columns the schema doesn't have."""
+
+    def __init__(self, problem: str, sql: str):
+        super().__init__(problem)
+        self.sql = sql
+
+
+def _quoted(tok: str) -> bool:
+    return tok.startswith('"')
+
+
+def _name(tok: str) -> str:
+    return tok[1:-1].replace('""', '"') if _quoted(tok) else tok
+
+
+def _ident(tok: str) -> bool:
+    return _quoted(tok) or bool(re.match(r"[A-Za-z_]", tok))
+
+
+class SchemaIndex:
+    """FULL_SCHEMA pre-indexed for lookups; build once, check() per statement."""
+
+    def __init__(self, schema: Dict[str, List[Dict]], dialect: str):
+        # PostgreSQL: quoted names are case-sensitive, unquoted fold to lower
+        self.exact = dialect.lower().startswith("postgres")
+        self.tables: Dict[str, Set[str]] = {t: {c["name"] for c in cols} for t, cols in schema.items()}
+        self._lower_tables = {t.lower(): t for t in self.tables}
+        self._lower_cols = {t: {c.lower() for c in cols} for t, cols in self.tables.items()}
+
+    def _table(self, tok: str) -> Optional[str]:
+        name = _name(tok)
+        if name in self.tables:
+            return name
+        if self.exact and _quoted(tok):
+            return None
+        return self._lower_tables.get(name.lower())
+
+    def _has(self, names: Set[str], lower: Set[str], tok: str) -> bool:
+        name = _name(tok)
+        return name in names or (not (self.exact and _quoted(tok)) and name.lower() in lower)
+
+    def check(self, sql: str) -> Optional[str]:
+        """None if the statement resolves against the schema, else a short problem description."""
+        toks = [t for t in _TOKEN.findall(sql or "") if not t.startswith("'")]
+        low = [t.lower() for t in toks]
+        n = len(toks)
+
+        tables: Set[str] = set()         # real tables referenced
+        aliases: Dict[str, Optional[str]] = {}  # alias / CTE -> real table (None = derived)
+        defined: Set[str] = set()        # names defined by AS
+        skip: Set[int] = set()           # token positions already accounted for
+        problems: List[str] = []
+
+        # CTE names: WITH x AS ( ... ), y AS ( ... )
+        for i in range(n - 2):
+            if low[i] in ("with", ",", "recursive") and _ident(toks[i + 1]) and low[i + 2] == "as" \
+                    and i + 3 < n and toks[i + 3] == "(":
+                aliases[_name(toks[i + 1]).lower()] = None
+                skip.add(i + 1)
+
+        stack: List[str] = []
+        for i, t in enumerate(low):
+            if t == "(":
+                stack.append(low[i - 1] if i else "")
+            elif t == ")":
+                if stack:
+                    stack.pop()
+            elif t == "as" and i + 1 < n and _ident(toks[i + 1]):
+                defined.add(_name(toks[i + 1]))
+                skip.add(i + 1)
+            elif _quoted(toks[i]) and i and (i + 1 == n or low[i + 1] in (",", "from", ")")) \
+                    and (toks[i - 1] == ")" or toks[i - 1][0].isdigit()
+                         or (_ident(toks[i - 1]) and low[i - 1] not in _NOT_EXPR_END)):
+                defined.add(_name(toks[i]))  # alias without AS: expr "name"
+                skip.add(i)
+            elif t in ("from", "join") and not (t == "from" and stack and stack[-1] in _FROM_FUNCS):
+                j = i + 1
+                while j < n:
+                    if toks[j] == "(":       # derived table: ( SELECT ... ) alias
+                        depth, j = 1, j + 1
+                        while j < n and depth:
+                            depth += {"(": 1, ")": -1}.get(toks[j], 0)
+                            j += 1
+                        real = None
+                    elif _ident(toks[j]):
+                        k = j
+                        while k + 2 < n and toks[k + 1] == "." and _ident(toks[k + 2]):
+                            k += 2              # schema.table -> table
+                        skip.update(range(j, k + 1))
+                        real = self._table(toks[k])
+                        if real is None and _name(toks[k]).lower() not in aliases:
+                            problems.append(f'Unknown table {_name(toks[k])!r}.')
+                        elif real is not None:
+                            tables.add(real)
+                        j = k + 1
+                    else:
+                        break
+                    if j < n and low[j] == "as":
+                        j += 1
+                    if j < n and _ident(toks[j]) and low[j] not in _CLAUSE:
+                        aliases[_name(toks[j]).lower()] = real
+                        skip.add(j)
+                        j += 1
+                    if j < n and toks[j] == "," and t == "from":
+                        j += 1
+                        continue
+                    break
+
+        columns: Set[str] = set()
+        lower_columns: Set[str] = set()
+        for t in tables:
+            columns |= self.tables[t]
+            lower_columns |= self._lower_cols[t]
+        lower_defined = {d.lower() for d in defined}
+
+        for i, tok in enumerate(toks):
+            if i in skip or not _ident(tok):
+                continue
+            if i + 1 < n and toks[i + 1] == ".":
+                continue  # qualifier; checked with its column below
+            if i >= 2 and toks[i - 1] == "." and _ident(toks[i - 2]):
+                q = _name(toks[i - 2]).lower()
+                real = aliases[q] if q in aliases else self._table(toks[i - 2])
+                if real is not None and not self._has(self.tables[real], self._lower_cols[real], tok):
+                    problems.append(f'Unknown column {_name(tok)!r} in table {real!r}.')
+                continue
+            if _quoted(tok) and not (self._has(columns, lower_columns, tok) or self._has(defined, lower_defined, tok)
+                                     or _name(tok).lower() in aliases or self._table(tok)):
+                problems.append(f'Unknown column {_name(tok)!r}.')
+
+        if not problems:
+            return None
+        listing = "; ".join(f"{t}({', '.join(sorted(self.tables[t])[:40])})" for t in sorted(tables))
+        if not listing:
+            listing = ", ".join(sorted(self.tables)[:40])
+        return " ".join(list(dict.fromkeys(problems))[:5]) + f" Available: {listing}."
+
+
+def feedback(sql: str, problem: str) -> str:
+    """Text fed back to the model for one repair attempt."""
+    return f"Your previous SQL was rejected before running.\nPREVIOUS SQL\n{sql}\nPROBLEM\n{problem}\n" \
+           "Use only tables and columns from the schema."
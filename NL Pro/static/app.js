@@ -1,8 +1,9 @@
-/* static/app.js v6 */
+/* static/app.js v7 */
 
 let chartInstance = null;
 let lastSQL = "";
 let lastResult = null; // { columns, types, rows }
+let lastResultId = ""; // server-side cached result, for follow-up refinements
 
 const $ = (s) => document.querySelector(s);
 
@@ -109,6 +110,101 @@ async function clearHistory() {
   refreshHistory();
 }
 
+// ---------------- Saved queries ----------------
+async function refreshSaved() {
+  const res = await fetch("/saved");
+  const data = await res.json();
+  const container = $("#saved-list");
+  if (!data.ok || !data.items || !data.items.length) {
+    container.textContent = "No saved queries yet.";
+    return;
+  }
+  container.innerHTML = "";
+  data.items.forEach((item) => {
+    const card = document.createElement("div");
+    card.className = "hist-card";
+    card.innerHTML = `
+      <div class="hist-ts">${item.schedule || "no schedule"} · refreshed ${
+      item.refreshed_at || "never"
+    }${item.last_error ? " · last refresh failed" : ""}</div>
+      <div class="hist-q">${item.name || ""}</div>
+      <button class="btn btn-light saved-open">Open</button>
+      <button class="btn btn-light saved-delete">Delete</button>
+    `;
+    card
+      .querySelector(".saved-open")
+      .addEventListener("click", () => openSaved(item.id));
+    card.querySelector(".saved-delete").addEventListener("click", async () => {
+      await fetch(`/saved/${item.id}`, { method: "DELETE" });
+      refreshSaved();
+    });
+    container.appendChild(card);
+  });
+}
+
+async function saveCurrent() {
+  if (!lastSQL) return;
+  const question = $("#question").value.trim();
+  const name = prompt("Name for this saved query:", question);
+  if (name === null) return;
+  const schedule = prompt(
+    "Refresh schedule (cron, e.g. 0 7 * * 1-5; leave empty for none):",
+    "0 7 * * 1-5"
+  );
+  if (schedule === null) return;
+  const res = await fetch("/saved", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({
+      name,
+      question,
+      sql: lastSQL,
+      tables: selectedTables(),
+      schedule,
+    }),
+  });
+  const data = await res.json();
+  if (!data.ok) {
+    alert(data.error || "Could not save the query.");
+    return;
+  }
+  refreshSaved();
+}
+
+async function openSaved(id) {
+  setText($("#sql-box"), "Loading saved query…");
+  const res = await fetch(`/saved/${id}/run`, { method: "POST" });
+  const data = await res.json();
+
+  if (!data.ok) {
+    setText($("#sql-box"), `Error: ${data.error || "Unknown"}`);
+    renderTable({ columns: [], rows: [] });
+    destroyChart();
+    hide($("#chart-controls"));
+    return;
+  }
+
+  lastSQL = data.sql || "";
+  lastResultId = data.result_id || "";
+  lastResult = {
+    columns: data.columns || [],
+    types: data.types || {},
+    rows: data.rows || [],
+  };
+
+  setText(
+    $("#sql-box"),
+    `${data.sql || ""}\n-- results as of ${data.refreshed_at || "now"}`
+  );
+  enable($("#export-csv"), true);
+  enable($("#export-xlsx"), true);
+  enable($("#export-parquet"), true);
+  enable($("#save-btn"), true);
+
+  renderTable(lastResult);
+  renderChartAuto(lastResult);
+}
+
 // ---------------- Query/Run ----------------
 async function runQueryFromQuestion() {
   const question = $("#question").value.trim();
@@ -120,11 +216,17 @@ async function runQueryFromQuestion() {
   setText($("#sql-box"), "Generating SQL…");
   enable($("#export-csv"), false);
   enable($("#export-xlsx"), false);
+  enable($("#export-parquet"), false);
+  enable($("#save-btn"), false);
 
   const res = await fetch("/query", {
     method: "POST",
     headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({ question, tables: selectedTables() }),
+    body: JSON.stringify({
+      question,
+      tables: selectedTables(),
+      result_id: lastResultId,
+    }),
   });
   const data = await res.json();
 
@@ -137,15 +239,23 @@ async function runQueryFromQuestion() {
   }
 
   lastSQL = data.sql || "";
+  lastResultId = data.result_id || "";
   lastResult = {
     columns: data.columns || [],
     types: data.types || {},
     rows: data.rows || [],
   };
 
-  setText($("#sql-box"), data.sql || "");
+  setText(
+    $("#sql-box"),
+    data.truncated
+      ? `${data.sql || ""}\n-- result truncated to the first ${data.row_count} rows`
+      : data.sql || ""
+  );
   enable($("#export-csv"), true);
   enable($("#export-xlsx"), true);
+  enable($("#export-parquet"), true);
+  enable($("#save-btn"), true);
 
   renderTable(lastResult);
   renderChartAuto(lastResult);
@@ -171,6 +281,7 @@ async function runSQLDirect(sql) {
   }
 
   lastSQL = data.sql || "";
+  lastResultId = data.result_id || "";
   lastResult = {
     columns: data.columns || [],
     types: data.types || {},
@@ -196,6 +307,8 @@ async function exportFile(path) {
   a.href = url;
   a.download = path.endsWith("csv")
     ? "query_results.csv"
+    : path.endsWith("parquet")
+    ? "query_results.parquet"
     : "query_results.xlsx";
   a.click();
   URL.revokeObjectURL(url);
@@ -443,16 +556,22 @@ function bindEvents() {
   $("#export-xlsx").addEventListener("click", () =>
     exportFile("/export/excel")
   );
+  $("#export-parquet").addEventListener("click", () =>
+    exportFile("/export/parquet")
+  );
   $("#plot-btn").addEventListener("click", manualPlot);
 
   $("#hist-refresh").addEventListener("click", refreshHistory);
   $("#hist-clear").addEventListener("click", clearHistory);
+  $("#save-btn").addEventListener("click", saveCurrent);
+  $("#saved-refresh").addEventListener("click", refreshSaved);
 }
 
 function init() {
   populateSchemaUI(window.APP_SCHEMA || {});
   bindEvents();
   refreshHistory();
+  refreshSaved();
 }
 
 document.addEventListener("DOMContentLoaded", init);
@@ -0,0 +1,88 @@
+# tests/test_export.py
+import io
+import sqlite3
+from decimal import Decimal
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+from services import export  # noqa: E402
+
+
+def _read(chunks) -> "pa.Table":
+    return pq.read_table(io.BytesIO(b"".join(chunks)))
+
+
+def _batches(rows, size):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def test_unconstrained_numeric_aggregate():
+    # psycopg2 cursor.description for SELECT team, AVG(spend): text, NUMERIC without precision
+    description = [("team", 25, None, -1, None, None, None), ("avg", 1700, None, -1, None, None, None)]
+    types = export.arrow_types(description, "postgresql")
+    rows = [("brand", Decimal("1.5")), ("retail", Decimal("2.3333333333333333")), ("ops", None)]
+
+    table = _read(export.parquet_chunks(["team", "avg"], types, _batches(rows, 2)))
+
+    assert table.schema.field("avg").type == pa.float64()
+    assert table.column("avg").to_pylist() == [1.5, 2.3333333333333333, None]
+
+
+def test_avg_on_sqlite_with_null_first_batch():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript("""
+        CREATE TABLE spends (team TEXT, spend REAL);
+        INSERT INTO spends VALUES ('a', NULL), ('b', 1.0), ('b', 2.0), ('c', 4.0);
+    """)
+    cur = conn.execute("SELECT team, AVG(spend) AS avg_spend FROM spends GROUP BY team ORDER BY team")
+    columns = [d[0] for d in cur.description]
+    types = export.arrow_types(cur.description, "sqlite")
+    rows = cur.fetchall()
+
+    # the first batch holds only team 'a', whose AVG is NULL
+    table = _read(export.parquet_chunks(columns, types, _batches(rows, 1)))
+
+    assert table.schema.field("avg_spend").type == pa.float64()
+    assert table.column("avg_spend").to_pylist() == [None, 1.5, 4.0]
+
+
+def test_inferred_types_hold_for_later_batches():
+    rows = [(None, 1, Decimal("1.5")), (None, 2.5, Decimal("2.125"))] + [(None, 3, Decimal("4"))] * 8
+    rows.append(("late", 4, Decimal("5")))
+
+    table = _read(export.parquet_chunks(["note", "n", "d"], [None] * 3, _batches(rows, 1)))
+
+    assert table.schema.field("note").type == pa.string()
+    assert table.column("note").to_pylist()[-1] == "late"
+    assert table.column("n").to_pylist()[:2] == [1.0, 2.5]
+    assert table.column("d").to_pylist()[:2] == [Decimal("1.5"), Decimal("2.125")]
+
+
+def test_inferred_integers_accept_a_later_float():
+    # no type metadata (SQLite / MySQL): the first batches only show integers
+    rows = [(i,) for i in range(export.PARQUET_INFER_BATCHES + 2)] + [(2.5,), (None,)]
+
+    table = _read(export.parquet_chunks(["n"], [None], _batches(rows, 1)))
+
+    assert table.schema.field("n").type == pa.float64()
+    assert table.column("n").to_pylist()[-3:] == [5.0, 2.5, None]
+
+
+def test_inferred_large_integers_stay_integers():
+    rows = [(2 ** 60,), (1,)]
+
+    table = _read(export.parquet_chunks(["id"], [None], _batches(rows, 1)))
+
+    assert table.schema.field("id").type == pa.int64()
+    assert table.column("id").to_pylist() == [2 ** 60, 1]
+
+
+def test_empty_result_keeps_columns():
+    table = _read(export.parquet_chunks(["a", "b"], [None, pa.int64()], iter([])))
+
+    assert table.num_rows == 0
+    assert table.column_names == ["a", "b"]
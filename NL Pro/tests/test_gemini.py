@@ -0,0 +1,158 @@
+# tests/test_gemini.py
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+os.environ.setdefault("LLM_BACKEND", "stub")
+
+from services import gemini, limits  # noqa: E402
+
+pytestmark = pytest.mark.skipif(gemini.LLM_BACKEND != "stub", reason="needs LLM_BACKEND=stub")
+
+SCHEMA = {"sample_data": [{"name": "brand_name", "type": "text"}]}
+
+
+class _Scripted(gemini._StubBackend):
+    """Stub whose calls follow a script of (latency, error) steps; the last one repeats."""
+
+    def __init__(self, name, steps):
+        super().__init__(name)
+        self.steps = list(steps)
+        self.active = self.peak = 0
+        self._lock = threading.Lock()
+
+    def _draw(self):
+        self.calls += 1
+        return self.steps[min(self.calls, len(self.steps)) - 1]
+
+    def _answer(self, delay, fail, timeout):
+        if delay > timeout:
+            raise TimeoutError(f"stub {self.name} timed out after {timeout:.1f}s")
+        if fail:
+            raise RuntimeError(fail)
+        return "SELECT brand_name FROM sample_data"
+
+    def generate(self, prompt, timeout):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            return super().generate(prompt, timeout)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+@pytest.fixture
+def backends(monkeypatch):
+    def install(primary, hedge=None, deadline=2.0, hedge_delay=0.05):
+        primary = _Scripted("primary", primary)
+        hedge = _Scripted("hedge", hedge) if hedge is not None else primary
+        monkeypatch.setattr(gemini, "_PRIMARY", primary)
+        monkeypatch.setattr(gemini, "_HEDGE", hedge)
+        monkeypatch.setattr(gemini, "LLM_DEADLINE_SECONDS", deadline)
+        monkeypatch.setattr(gemini, "LLM_HEDGE_DELAY", hedge_delay)
+        monkeypatch.setattr(gemini, "LLM_HEDGE_MIN_DELAY", 0.0)
+        monkeypatch.setattr(gemini, "LLM_BACKOFF_SECONDS", 0.01)
+        monkeypatch.setattr(gemini, "_latencies", gemini.deque(maxlen=gemini.LLM_HEDGE_WINDOW))
+        return primary, hedge
+
+    return install
+
+
+def test_hedge_answers_when_the_primary_is_slow(backends):
+    primary, hedge = backends(primary=[(5.0, None)], hedge=[(0.01, None)])
+
+    t0 = time.monotonic()
+    sql = gemini.generate_sql("brands", SCHEMA)
+
+    assert "brand_name" in sql
+    assert time.monotonic() - t0 < 1.0
+    assert hedge.calls == 1
+
+
+def test_transient_errors_are_retried(backends):
+    primary, _ = backends(primary=[(0.0, "503 unavailable"), (0.0, "503 unavailable"), (0.0, None)])
+
+    assert "brand_name" in gemini.generate_sql("brands", SCHEMA)
+    assert primary.calls == 3
+
+
+def test_permanent_errors_are_not_retried(backends):
+    primary, _ = backends(primary=[(0.0, "400 invalid argument")])
+
+    with pytest.raises(RuntimeError, match="Gemini API error"):
+        gemini.generate_sql("brands", SCHEMA)
+    assert primary.calls == 1
+
+
+def test_deadline_raises_llm_timeout(backends):
+    backends(primary=[(5.0, None)], hedge=[(5.0, None)], deadline=0.3)
+
+    t0 = time.monotonic()
+    with pytest.raises(gemini.LLMTimeout):
+        gemini.generate_sql("brands", SCHEMA)
+    assert time.monotonic() - t0 < 1.0
+
+
+def test_request_timeout_at_the_deadline_is_llm_timeout(backends, monkeypatch):
+    # the request's own timeout equals the time left, so it fires together with wait()
+    monkeypatch.setattr(gemini, "LLM_HEDGE", False)
+    for _ in range(20):
+        backends(primary=[(5.0, None)], deadline=0.05)
+        with pytest.raises(gemini.LLMTimeout):
+            gemini.generate_sql("brands", SCHEMA)
+
+
+def test_each_request_takes_a_bulkhead_slot(backends):
+    primary, hedge = backends(primary=[(0.3, None)], hedge=[(0.01, None)])
+    gate = limits.Bulkhead("llm_test", 1, 4, 5)
+
+    # the primary holds the only slot, so the hedge is skipped rather than queued
+    assert "brand_name" in gemini.generate_sql("brands", SCHEMA, gate=gate)
+    assert hedge.calls == 0
+    assert gate.stats()["in_flight"] == 0
+
+    gate = limits.Bulkhead("llm_test", 2, 4, 5)
+    primary, hedge = backends(primary=[(0.3, None)], hedge=[(0.01, None)])
+    assert "brand_name" in gemini.generate_sql("brands", SCHEMA, gate=gate)
+    assert hedge.calls == 1
+    time.sleep(0.4)  # the losing primary releases its slot when it finishes
+    assert gate.stats()["in_flight"] == 0
+
+
+def test_concurrent_calls_stay_within_the_bulkhead(backends):
+    primary, _ = backends(primary=[(0.1, None)], hedge_delay=0.01)
+    gate = limits.Bulkhead("llm_test", 3, 32, 5)
+
+    threads = [threading.Thread(target=gemini.generate_sql, args=("brands", SCHEMA), kwargs={"gate": gate})
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    time.sleep(0.2)  # losing requests finish in the pool
+
+    assert primary.peak <= 3
+    assert gate.stats()["in_flight"] == 0
+
+
+def test_async_deadline_and_hedge(backends):
+    backends(primary=[(5.0, None)], hedge=[(5.0, None)], deadline=0.2)
+    with pytest.raises(gemini.LLMTimeout):
+        asyncio.run(gemini.generate_sql_async("brands", SCHEMA))
+
+    backends(primary=[(5.0, None)], hedge=[(0.01, None)])
+
+    async def run():
+        gate = limits.AsyncBulkhead("llm_test", 2, 4, 5)
+        sql = await gemini.generate_sql_async("brands", SCHEMA, gate=gate)
+        await asyncio.sleep(0.01)  # let the cancelled primary finish and release its slot
+        return sql, gate.stats()["in_flight"]
+
+    sql, in_flight = asyncio.run(run())
+    assert "brand_name" in sql
+    assert in_flight == 0
@@ -0,0 +1,10 @@
+# wsgi.py
+"""
+Production entry point:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app (schema introspection included) is imported once in the master
+and inherited by forked workers; see gunicorn.conf.py.
+"""
+from app import app  # noqa: F401